@@ -0,0 +1,61 @@
+import argparse
+import time
+from scraper.models.fmcsa.extraction_backend import LxmlBackend, ShadowBackend, TokenBackend
+from .corpus import PAGE_URLS, bodies, load_pages
+
+
+def run(directory, page_key='safer', limit=None, repeat=5):
+    """
+        compare TokenBackend to LxmlBackend on every recorded page,
+        then time both from the page bytes, parsing included
+        returns (ShadowBackend, {backend name: seconds per page}, fields left to lxml)
+    """
+    page_cls = PAGE_URLS[page_key]
+    pages = load_pages(page_cls, bodies(directory, page_key, limit))
+    if not pages:
+        raise SystemExit("no {0} pages in {1}".format(page_key, directory))
+    lxml = LxmlBackend(page_cls)
+    tokens = TokenBackend(page_cls, getattr(page_cls, 'LABELS', None))
+    shadow = ShadowBackend(lxml, tokens, sample=1.0)
+    for page in pages:
+        shadow.fill(page, {})
+
+    timings = {}
+    for backend in (lxml, tokens):
+        best = None
+        for _ in range(repeat):
+            for page in pages:
+                # start from the bytes, as a freshly fetched page does
+                page._root = None
+            started = time.perf_counter()
+            for page in pages:
+                backend.fill(page, {})
+            elapsed = (time.perf_counter() - started) / len(pages)
+            best = elapsed if best is None else min(best, elapsed)
+        timings[backend.name] = best
+    return shadow, timings, sorted(set(lxml.fields) - set(tokens.fields))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare extraction backends over a recorded corpus')
+    parser.add_argument('corpus')
+    parser.add_argument('--page', default='safer', choices=sorted(PAGE_URLS))
+    parser.add_argument('--limit', type=int)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    shadow, timings, unsupported = run(args.corpus, args.page, args.limit, args.repeat)
+    stats = shadow.stats()
+    print("{0} pages, {1} with differences".format(stats['sampled'], stats['disagreeing']))
+    for page, dot_number, name, value, candidate in shadow.report():
+        print("  {0} {1}: lxml {2!r}, tokens {3!r}".format(dot_number, name, value, candidate))
+    if unsupported:
+        print("left to lxml: {0}".format(', '.join(unsupported)))
+    for name, seconds in timings.items():
+        print("{0:>8}: {1:.3f} ms per page".format(name, seconds * 1000))
+    if stats['disagreeing']:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
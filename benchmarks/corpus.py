@@ -0,0 +1,61 @@
+from urllib.parse import urlsplit
+from scraper.config import Settings
+from scraper.models.fmcsa.fetch import Corpus
+from scraper.models.fmcsa.scraper import (
+    ActiveInsurancePage,
+    AuthorityHistoryPage,
+    InsuranceHistoryPage,
+    LicensePage,
+    PendingApplicationPage,
+    RejectedInsurancePage,
+    RevocationPage,
+    SaferPage
+)
+from scraper.models.fmcsa.scraper.parse_pool import ReportCollector
+from scraper.models.fmcsa.scraper_property import ScraperProperty
+
+
+# Settings().fmcsa_urls key of the url each page is fetched from
+PAGE_URLS = {
+    'safer': SaferPage,
+    'insurance_detail': LicensePage,
+    'insurance_history': InsuranceHistoryPage,
+    'insurance_active': ActiveInsurancePage,
+    'insurance_rejected': RejectedInsurancePage,
+    'authority_history': AuthorityHistoryPage,
+    'insurance_pending': PendingApplicationPage,
+    'insurance_revocation': RevocationPage
+}
+
+
+def bodies(directory, page_key, limit=None):
+    """
+        @directory: a replay corpus, see fetch.replay
+        @page_key: key of PAGE_URLS
+        returns [(dot number, body)] recorded for that page
+    """
+    path = urlsplit(Settings().fmcsa_urls[page_key]).path
+    found = []
+    for url, params, body in Corpus(directory):
+        if urlsplit(url).path != path or not body:
+            continue
+        dot_number = params.get('query_string') or params.get('n_dotno') or params.get('pv_apcant_id')
+        found.append((dot_number, body))
+        if limit is not None and len(found) >= limit:
+            break
+    return found
+
+
+def load_pages(page_cls, recorded):
+    """ pages built from @recorded bodies, never persisted """
+    return [page_cls.from_html(dot_number, body, manager=ReportCollector()) for dot_number, body in recorded]
+
+
+def descriptors(page_cls):
+    """ {name: ScraperProperty} of @page_cls """
+    found = {}
+    for cls in reversed(page_cls.__mro__):
+        for name, value in vars(cls).items():
+            if isinstance(value, ScraperProperty):
+                found[name] = value
+    return found
@@ -0,0 +1,67 @@
+import argparse
+import time
+from .corpus import PAGE_URLS, bodies, descriptors, load_pages
+
+
+def _timed(pages, evaluate):
+    """ seconds per page for @evaluate(page) over @pages """
+    started = time.perf_counter()
+    for page in pages:
+        evaluate(page)
+    return (time.perf_counter() - started) / len(pages)
+
+
+def run(directory, page_key='safer', limit=None, repeat=5):
+    """
+        per page XPath time of every descriptor of the page,
+        with the expression string as before and compiled as now,
+        plus the whole descriptor (XPath and text collection)
+    """
+    page_cls = PAGE_URLS[page_key]
+    pages = load_pages(page_cls, bodies(directory, page_key, limit))
+    if not pages:
+        raise SystemExit("no {0} pages in {1}".format(page_key, directory))
+    for page in pages:
+        page.root
+    props = descriptors(page_cls)
+
+    def strings(page):
+        for prop in props.values():
+            page.root.xpath(prop.expr)
+
+    def compiled(page):
+        for prop in props.values():
+            prop.xpath(page.root)
+
+    def values(page):
+        # the descriptors keep their values, read them fresh
+        page.invalidate()
+        for name in props:
+            try:
+                getattr(page, name)
+            except Exception:
+                # a page without the table, as create_report would skip it
+                pass
+
+    results = {}
+    for label, evaluate in (('string xpath', strings), ('compiled xpath', compiled), ('descriptors', values)):
+        results[label] = min(_timed(pages, evaluate) for _ in range(repeat))
+    return page_cls.__name__, len(pages), len(props), results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time descriptor extraction over a recorded corpus')
+    parser.add_argument('corpus')
+    parser.add_argument('--page', default='safer', choices=sorted(PAGE_URLS))
+    parser.add_argument('--limit', type=int)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    name, count, props, results = run(args.corpus, args.page, args.limit, args.repeat)
+    print("{0}: {1} pages, {2} descriptors".format(name, count, props))
+    for label, seconds in results.items():
+        print("{0:>16}: {1:.3f} ms per page".format(label, seconds * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+import argparse
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor
+from io import StringIO
+from lxml import etree
+from scraper.models.fmcsa.html_parser import ENCODING, parse_html
+from .corpus import PAGE_URLS, bodies, descriptors, load_pages
+
+
+def parse_before(body):
+    """ as every page parsed before html_parser: decode, StringIO, a new parser """
+    return etree.parse(StringIO(body.decode(ENCODING)), etree.HTMLParser())
+
+
+METHODS = (('new parser, str', parse_before), ('shared parser, bytes', parse_html))
+
+
+def _timed(recorded, parse, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for dot_number, body in recorded:
+            parse(body)
+        elapsed = (time.perf_counter() - started) / len(recorded)
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def _peak_rss(recorded, method):
+    """
+        run in a fresh process: KB of peak RSS added per page
+        while the trees of every page are held, as a crawl batch holds them
+    """
+    parse = dict(METHODS)[method]
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    trees = [parse(body) for dot_number, body in recorded]
+    after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return (after - before) / len(trees)
+
+
+def _values(page, props):
+    values = {}
+    page.invalidate()
+    for name in props:
+        try:
+            values[name] = getattr(page, name)
+        except Exception as e:
+            values[name] = type(e).__name__
+    return values
+
+
+def differences(page_cls, recorded):
+    """
+        descriptor values read from both parses of every page
+        returns {dot number: {name: (shared parser value, before value)}}
+    """
+    props = descriptors(page_cls)
+    found = {}
+    for page, (dot_number, body) in zip(load_pages(page_cls, recorded), recorded):
+        page._root = parse_before(body)
+        before = _values(page, props)
+        page._root = parse_html(body)
+        after = _values(page, props)
+        changed = {name: (after[name], before[name]) for name in props if after[name] != before[name]}
+        if changed:
+            found[dot_number] = changed
+    return found
+
+
+def run(directory, page_key, limit=None, repeat=5):
+    """
+        returns (pages, {method: (seconds per page, KB peak RSS per page)}, differences)
+    """
+    recorded = bodies(directory, page_key, limit)
+    if not recorded:
+        return 0, {}, {}
+    results = {}
+    for method, parse in METHODS:
+        with ProcessPoolExecutor(1) as executor:
+            rss = executor.submit(_peak_rss, recorded, method).result()
+        results[method] = (_timed(recorded, parse, repeat), rss)
+    return len(recorded), results, differences(PAGE_URLS[page_key], recorded)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time and size page parsing over a recorded corpus')
+    parser.add_argument('corpus')
+    parser.add_argument('--page', choices=sorted(PAGE_URLS), help='every page type by default')
+    parser.add_argument('--limit', type=int)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    for page_key in ([args.page] if args.page else sorted(PAGE_URLS)):
+        count, results, changed = run(args.corpus, page_key, args.limit, args.repeat)
+        if not count:
+            continue
+        print("{0}: {1} pages, {2} with different values".format(PAGE_URLS[page_key].__name__, count, len(changed)))
+        for method, (seconds, rss) in results.items():
+            print("{0:>22}: {1:.3f} ms, {2:.1f} KB peak RSS per page".format(method, seconds * 1000, rss))
+        for dot_number, values in sorted(changed.items()):
+            for name, (after, before) in sorted(values.items()):
+                print("  {0} {1}: {2!r}, before {3!r}".format(dot_number, name, after, before))
+
+
+if __name__ == '__main__':
+    main()
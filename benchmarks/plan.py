@@ -0,0 +1,77 @@
+import argparse
+import time
+from scraper.models.fmcsa.extraction_plan import ExtractionPlan
+from .corpus import PAGE_URLS, bodies, load_pages
+
+
+def run(directory, page_key='safer', limit=None, repeat=5, labels=False):
+    """
+        check the page's ExtractionPlan against each descriptor on every
+        recorded page, then time both ways of extracting all fields
+        @labels: check a plan built with the page class's LABELS instead
+        returns (pages, {dot number: differences}, {label: seconds per page})
+    """
+    page_cls = PAGE_URLS[page_key]
+    if labels:
+        plan = ExtractionPlan(page_cls, getattr(page_cls, 'LABELS', None))
+    else:
+        plan = page_cls.extraction_plan
+    if plan is None:
+        raise SystemExit("{0} has no extraction plan".format(page_cls.__name__))
+    pages = load_pages(page_cls, bodies(directory, page_key, limit))
+    if not pages:
+        raise SystemExit("no {0} pages in {1}".format(page_key, directory))
+    for page in pages:
+        page.root
+
+    mismatches = {}
+    for page in pages:
+        differences = plan.verify(page)
+        if differences:
+            mismatches[page.dot_number] = differences
+
+    def each_descriptor(page):
+        for prop in plan.properties.values():
+            try:
+                prop.extract(page)
+            except Exception:
+                pass
+
+    def planned(page):
+        plan.fill(page, {})
+
+    timings = {}
+    for label, evaluate in (('per descriptor', each_descriptor), ('planned', planned)):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            for page in pages:
+                evaluate(page)
+            elapsed = (time.perf_counter() - started) / len(pages)
+            best = elapsed if best is None else min(best, elapsed)
+        timings[label] = best
+    return len(pages), mismatches, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Verify and time an extraction plan over a recorded corpus')
+    parser.add_argument('corpus')
+    parser.add_argument('--page', default='safer', choices=sorted(PAGE_URLS))
+    parser.add_argument('--limit', type=int)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--labels', action='store_true', help='look labelled fields up by their th label')
+    args = parser.parse_args()
+
+    count, mismatches, timings = run(args.corpus, args.page, args.limit, args.repeat, args.labels)
+    print("{0} pages, {1} with differences".format(count, len(mismatches)))
+    for dot_number, differences in sorted(mismatches.items()):
+        for name, (planned, expected) in sorted(differences.items()):
+            print("  {0} {1}: planned {2!r}, expected {3!r}".format(dot_number, name, planned, expected))
+    for label, seconds in timings.items():
+        print("{0:>16}: {1:.3f} ms per page".format(label, seconds * 1000))
+    if mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+import argparse
+import re
+import time
+from scraper.models.fmcsa.scraper_property import ScraperProperty, ScraperRowProperty
+from .corpus import PAGE_URLS, bodies, descriptors, load_pages
+
+
+def recursive_texts(element, text_list):
+    """ the collector ScraperProperty.from_nodes used before iter_texts """
+    if isinstance(element, str):
+        text_list.append(element)
+    else:
+        for child in element.getchildren():
+            recursive_texts(child, text_list)
+        if element.text is not None:
+            text_list.append(element.text)
+    return text_list
+
+
+def recursive_row(element, text_list):
+    """ the collector ScraperRowProperty used before iter_texts """
+    for child in element.getchildren():
+        recursive_row(child, text_list)
+    if element.text is not None:
+        m = re.match(r'^([ -~]+)$', element.text)
+        if m:
+            text_list.append(m.group(1))
+        if element.tag == 'td' and element.text == '':
+            text_list.append(' ')
+    return text_list
+
+
+def recursive_value(prop, node):
+    """ ScraperProperty.from_nodes as it was """
+    text_list = []
+    if hasattr(node, 'text') and node.text is not None:
+        text_list.append(node.text)
+    else:
+        for elem in node:
+            recursive_texts(elem, text_list)
+    if len(text_list) > 3:
+        raise ValueError("Received more than two values for {0} text".format(node))
+    return ' '.join(text_list)
+
+
+def recursive_rows(prop, table):
+    """ ScraperRowProperty.from_nodes as it was """
+    return [dict(zip(prop.fields, recursive_row(tr, []))) for tr in table[0].getchildren() if prop.is_row(tr)]
+
+
+def _collected(pages, props):
+    """ [(dot number, name, property, nodes)] of the descriptors that collect text """
+    work = []
+    for page in pages:
+        for name, prop in props.items():
+            if type(prop) in (ScraperProperty, ScraperRowProperty):
+                work.append((page.dot_number, name, prop, prop.xpath(page.root)))
+    return work
+
+
+def _outcome(evaluate, prop, nodes):
+    try:
+        return evaluate(prop, nodes)
+    except Exception as e:
+        return type(e).__name__
+
+
+def run(directory, page_key='safer', limit=None, repeat=5):
+    """
+        the values of every text collecting descriptor, recursive and shared
+        returns (values compared, [(dot number, name, shared, recursive)], {label: seconds per value})
+    """
+    page_cls = PAGE_URLS[page_key]
+    pages = load_pages(page_cls, bodies(directory, page_key, limit))
+    if not pages:
+        raise SystemExit("no {0} pages in {1}".format(page_key, directory))
+    work = _collected(pages, descriptors(page_cls))
+    if not work:
+        raise SystemExit("{0} has no text collecting descriptors".format(page_cls.__name__))
+
+    def recursive(prop, nodes):
+        if type(prop) is ScraperRowProperty:
+            return recursive_rows(prop, nodes)
+        return recursive_value(prop, nodes)
+
+    def shared(prop, nodes):
+        return prop.from_nodes(nodes)
+
+    mismatches = []
+    for dot_number, name, prop, nodes in work:
+        expected = _outcome(recursive, prop, nodes)
+        value = _outcome(shared, prop, nodes)
+        if value != expected:
+            mismatches.append((dot_number, name, value, expected))
+
+    timings = {}
+    for label, evaluate in (('recursive', recursive), ('iter_texts', shared)):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            for dot_number, name, prop, nodes in work:
+                _outcome(evaluate, prop, nodes)
+            elapsed = (time.perf_counter() - started) / len(work)
+            best = elapsed if best is None else min(best, elapsed)
+        timings[label] = best
+    return len(work), mismatches, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check and time the shared text collector over a recorded corpus')
+    parser.add_argument('corpus')
+    parser.add_argument('--page', default='insurance_history', choices=sorted(PAGE_URLS))
+    parser.add_argument('--limit', type=int)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    count, mismatches, timings = run(args.corpus, args.page, args.limit, args.repeat)
+    print("{0} values, {1} different".format(count, len(mismatches)))
+    for dot_number, name, value, expected in mismatches:
+        print("  {0} {1}: {2!r}, recursive {3!r}".format(dot_number, name, value, expected))
+    for label, seconds in timings.items():
+        print("{0:>12}: {1:.1f} us per value".format(label, seconds * 1e6))
+    if mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,14 @@
+from .carrier_id import CarrierIdCache, CarrierIdEntry
+from .html_cache import HTMLCache
+from .lru import LRUCache
+from .negative import NegativeCache, NegativeEntry
+
+
+__all__ = [
+    CarrierIdCache,
+    CarrierIdEntry,
+    HTMLCache,
+    LRUCache,
+    NegativeCache,
+    NegativeEntry
+]
@@ -0,0 +1,108 @@
+from datetime import datetime, timedelta
+from sqlalchemy import Column, DateTime, String
+from scraper.models import BaseModel
+from .lru import LRUCache
+
+
+class CarrierIdEntry(BaseModel):
+    """
+        ORM definition for the LI internal id of a DOT number
+        the form parameters every insurance detail page is keyed by
+    """
+    __tablename__ = 'li_carrier_id'
+
+    dot_number = Column(String(10), primary_key=True)
+    pv_apcant_id = Column(String(32))
+    pv_vpath = Column(String(64))
+    fetched_at = Column(DateTime, nullable=False)
+
+    def params(self):
+        return {'pv_apcant_id': self.pv_apcant_id, 'pv_vpath': self.pv_vpath}
+
+    def __repr__(self):
+        """ used for debugging """
+        return "<CarrierIdEntry(dot_number={0}, pv_apcant_id={1})>".format(self.dot_number, self.pv_apcant_id)
+
+
+class CarrierIdCache:
+    """
+        DOT number -> insurance detail params
+        an in process LRU in front of the li_carrier_id table
+        @shard: Shard for the fmcsa schema, not joined to the zope transaction
+        @ttl: timedelta after which an entry is looked up again
+        @maxsize: entries kept in the LRU
+    """
+    DEFAULT_TTL = timedelta(days=30)
+    DEFAULT_MAXSIZE = 10000
+
+    def __init__(self, shard, ttl=DEFAULT_TTL, maxsize=DEFAULT_MAXSIZE):
+        self.shard = shard
+        self.ttl = ttl
+        self.lru = LRUCache(maxsize)
+        self.hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, dot_number):
+        """
+            returns a fresh params dict or None
+        """
+        entry = self.lru.get(dot_number)
+        if entry is None:
+            row = self.shard.query(CarrierIdEntry).filter(CarrierIdEntry.dot_number == dot_number).first()
+            if row is None:
+                self.misses += 1
+                return None
+            entry = (row.params(), row.fetched_at)
+            self.lru.put(dot_number, entry)
+            self.db_hits += 1
+        else:
+            self.hits += 1
+
+        params, fetched_at = entry
+        if datetime.utcnow() - fetched_at > self.ttl:
+            self.invalidate(dot_number)
+            return None
+        return dict(params)
+
+    def put(self, dot_number, params):
+        """
+            @params: dict with pv_apcant_id and pv_vpath
+            scraped from the insurance_base page
+        """
+        fetched_at = datetime.utcnow()
+        self.lru.put(dot_number, (dict(params), fetched_at))
+        entry = CarrierIdEntry(
+            dot_number=dot_number,
+            pv_apcant_id=params.get('pv_apcant_id'),
+            pv_vpath=params.get('pv_vpath'),
+            fetched_at=fetched_at
+        )
+        try:
+            self.shard.merge(entry)
+            self.shard.commit()
+        except Exception as e:
+            print("Caught Exception storing carrier id for {0}: {1}".format(dot_number, str(e)))
+            self.shard.rollback()
+
+    def invalidate(self, dot_number):
+        """
+            forget @dot_number, called when a lookup with its params fails
+        """
+        self.invalidations += 1
+        self.lru.pop(dot_number)
+        try:
+            self.shard.query(CarrierIdEntry).filter(CarrierIdEntry.dot_number == dot_number).delete()
+            self.shard.commit()
+        except Exception as e:
+            print("Caught Exception invalidating carrier id for {0}: {1}".format(dot_number, str(e)))
+            self.shard.rollback()
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'db_hits': self.db_hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations
+        }
@@ -0,0 +1,142 @@
+import gzip
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+
+class HTMLCache:
+    """
+        content addressed store of fetched pages on disk
+        @directory: root of the cache
+        @max_bytes: size bound for stored bodies,
+            least recently used bodies are removed past it
+
+        objects/<digest[:2]>/<digest>.gz  gzip compressed body
+        refs/<page type>/<dot number>     digest of the last stored body
+
+        refs are tiny and are never evicted,
+        so a digest comparison works even after its body is gone
+    """
+    DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._objects = OrderedDict()
+        self._size = 0
+        self._scan()
+
+    def _scan(self):
+        """ index the bodies already on disk, oldest first """
+        found = []
+        objects = os.path.join(self.directory, 'objects')
+        os.makedirs(objects, exist_ok=True)
+        for prefix in os.scandir(objects):
+            if not prefix.is_dir():
+                continue
+            for entry in os.scandir(prefix.path):
+                stat = entry.stat()
+                found.append((stat.st_mtime, entry.name[:-3], stat.st_size))
+        for _, digest, size in sorted(found):
+            self._objects[digest] = size
+            self._size += size
+
+    def _object_path(self, digest):
+        return os.path.join(self.directory, 'objects', digest[:2], digest + '.gz')
+
+    def _ref_path(self, page_type, dot_number):
+        return os.path.join(self.directory, 'refs', page_type, str(dot_number))
+
+    def _write(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = '{0}.{1}.tmp'.format(path, threading.get_ident())
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    @staticmethod
+    def digest_of(body):
+        return hashlib.sha256(body).hexdigest()
+
+    def digest(self, page_type, dot_number):
+        """ digest of the last body marked for this page, or None """
+        try:
+            with open(self._ref_path(page_type, dot_number)) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def is_unchanged(self, page_type, dot_number, digest):
+        """
+            compare @digest to the last marked one
+            counts a hit when they are equal, a miss otherwise
+        """
+        unchanged = self.digest(page_type, dot_number) == digest
+        with self._lock:
+            if unchanged:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return unchanged
+
+    def put(self, body):
+        """
+            store @body, returns its digest
+        """
+        digest = self.digest_of(body)
+        path = self._object_path(digest)
+        with self._lock:
+            if digest in self._objects:
+                self._objects.move_to_end(digest)
+                os.utime(path)
+                return digest
+
+        data = gzip.compress(body)
+        self._write(path, data)
+        with self._lock:
+            self._objects[digest] = len(data)
+            self._size += len(data)
+            self._evict()
+        return digest
+
+    def mark(self, page_type, dot_number, digest):
+        """
+            record @digest as the last body for this page
+            done once its report has been persisted
+        """
+        self._write(self._ref_path(page_type, dot_number), digest.encode('ascii'))
+
+    def load(self, page_type, dot_number):
+        """ last marked body for this page as bytes, or None """
+        digest = self.digest(page_type, dot_number)
+        if digest is None:
+            return None
+        try:
+            with open(self._object_path(digest), 'rb') as f:
+                return gzip.decompress(f.read())
+        except FileNotFoundError:
+            return None
+
+    def _evict(self):
+        while self._size > self.max_bytes and self._objects:
+            digest, size = self._objects.popitem(last=False)
+            self._size -= size
+            self.evictions += 1
+            try:
+                os.remove(self._object_path(digest))
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'objects': len(self._objects),
+            'bytes': self._size
+        }
@@ -0,0 +1,118 @@
+from datetime import datetime, timedelta
+from sqlalchemy import Column, DateTime, String
+from scraper.models import BaseModel
+from scraper.models.fmcsa.exceptions import BadDOTNumber, RecordNotFound
+from .lru import LRUCache
+
+
+class NegativeEntry(BaseModel):
+    """
+        ORM definition for a DOT number SAFER has no active record for
+        @outcome: NegativeCache.NOT_FOUND or NegativeCache.INACTIVE
+    """
+    __tablename__ = 'dot_negative'
+
+    dot_number = Column(String(10), primary_key=True)
+    outcome = Column(String(16), nullable=False)
+    checked_at = Column(DateTime, nullable=False)
+
+    def __repr__(self):
+        """ used for debugging """
+        return "<NegativeEntry(dot_number={0}, outcome={1})>".format(self.dot_number, self.outcome)
+
+
+class NegativeCache:
+    """
+        DOT numbers known to be dead, checked before any fetch
+        an in process LRU in front of the dot_negative table
+        @shard: Shard for the fmcsa schema, not joined to the zope transaction
+        @not_found_ttl: timedelta a "No records matching" answer is trusted
+        @inactive_ttl: timedelta an inactive record is trusted,
+            shorter, carriers do come back
+        @maxsize: entries kept in the LRU
+    """
+    NOT_FOUND = 'not_found'
+    INACTIVE = 'inactive'
+    DEFAULT_NOT_FOUND_TTL = timedelta(days=30)
+    DEFAULT_INACTIVE_TTL = timedelta(days=7)
+    DEFAULT_MAXSIZE = 100000
+
+    def __init__(self, shard, not_found_ttl=DEFAULT_NOT_FOUND_TTL, inactive_ttl=DEFAULT_INACTIVE_TTL,
+                 maxsize=DEFAULT_MAXSIZE):
+        self.shard = shard
+        self.ttls = {self.NOT_FOUND: not_found_ttl, self.INACTIVE: inactive_ttl}
+        self.lru = LRUCache(maxsize)
+        self.hits = {self.NOT_FOUND: 0, self.INACTIVE: 0}
+        self.misses = 0
+        self.stored = 0
+
+    def get(self, dot_number):
+        """
+            returns NOT_FOUND, INACTIVE or None
+        """
+        entry = self.lru.get(dot_number)
+        if entry is None:
+            row = self.shard.query(NegativeEntry).filter(NegativeEntry.dot_number == dot_number).first()
+            if row is None:
+                # remembered, so a live number costs one query per process
+                self.lru.put(dot_number, (None, None))
+                self.misses += 1
+                return None
+            entry = (row.outcome, row.checked_at)
+            self.lru.put(dot_number, entry)
+
+        outcome, checked_at = entry
+        if outcome is None:
+            self.misses += 1
+            return None
+        if datetime.utcnow() - checked_at > self.ttls[outcome]:
+            self.lru.pop(dot_number)
+            self.misses += 1
+            return None
+        self.hits[outcome] += 1
+        return outcome
+
+    def check(self, dot_number):
+        """
+            raises RecordNotFound or BadDOTNumber, as SaferPage would,
+            for a DOT number known to be dead
+        """
+        outcome = self.get(dot_number)
+        if outcome == self.NOT_FOUND:
+            raise RecordNotFound("{0} is not a valid DOT number (cached)".format(dot_number))
+        if outcome == self.INACTIVE:
+            raise BadDOTNumber('{0} is not a currently active DOT number (cached)'.format(dot_number))
+
+    def put(self, dot_number, outcome):
+        """
+            @outcome: NOT_FOUND or INACTIVE
+        """
+        checked_at = datetime.utcnow()
+        self.lru.put(dot_number, (outcome, checked_at))
+        try:
+            self.shard.merge(NegativeEntry(dot_number=dot_number, outcome=outcome, checked_at=checked_at))
+            self.shard.commit()
+            self.stored += 1
+        except Exception as e:
+            print("Caught Exception storing negative entry for {0}: {1}".format(dot_number, str(e)))
+            self.shard.rollback()
+
+    def invalidate(self, dot_number):
+        """
+            forget @dot_number, called when SAFER has a record for it again
+        """
+        self.lru.pop(dot_number)
+        try:
+            self.shard.query(NegativeEntry).filter(NegativeEntry.dot_number == dot_number).delete()
+            self.shard.commit()
+        except Exception as e:
+            print("Caught Exception invalidating negative entry for {0}: {1}".format(dot_number, str(e)))
+            self.shard.rollback()
+
+    def stats(self):
+        return {
+            'not_found_hits': self.hits[self.NOT_FOUND],
+            'inactive_hits': self.hits[self.INACTIVE],
+            'misses': self.misses,
+            'stored': self.stored
+        }
@@ -0,0 +1,10 @@
+from .frontier import Frontier, FrontierItem
+from .scheduler import CrawlSchedule, RecrawlScheduler
+
+
+__all__ = [
+    CrawlSchedule,
+    Frontier,
+    FrontierItem,
+    RecrawlScheduler
+]
@@ -0,0 +1,172 @@
+import os
+import socket
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import Column, DateTime, Integer, String, or_
+from sqlalchemy.dialects.postgresql import insert
+from scraper.db import Shard
+from scraper.models import BaseModel
+
+
+class FrontierItem(BaseModel):
+    """
+        ORM definition for a pending crawl of one page of one carrier
+        lease_owner and lease_expires are set while a worker holds it
+    """
+    __tablename__ = 'crawl_frontier'
+
+    dot_number = Column(String(10), primary_key=True)
+    page_type = Column(String(32), primary_key=True)
+    due_at = Column(DateTime, nullable=False, index=True)
+    lease_owner = Column(String(128))
+    lease_expires = Column(DateTime, index=True)
+    attempts = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        """ used for debugging """
+        return "<FrontierItem(dot_number={0}, page_type={1}, lease_owner={2})>".format(
+            self.dot_number, self.page_type, self.lease_owner)
+
+
+class Frontier:
+    """
+        work queue shared by every crawl node through the fmcsa shard
+        @shard: Shard for the fmcsa schema, not joined to the zope transaction
+        @worker_id: name of this worker in lease_owner, host:pid by default
+        @lease: timedelta a claim is held without a heartbeat,
+            after it the items go back to the other workers
+        @batch_size: items claimed at once
+
+        claims use SELECT ... FOR UPDATE SKIP LOCKED so workers
+        never wait on each other or take the same item
+    """
+    DEFAULT_LEASE = timedelta(minutes=5)
+    DEFAULT_BATCH_SIZE = 100
+
+    def __init__(self, shard, worker_id=None, lease=DEFAULT_LEASE, batch_size=DEFAULT_BATCH_SIZE):
+        self.shard = shard
+        self.worker_id = worker_id or '{0}:{1}'.format(socket.gethostname(), os.getpid())
+        self.lease = lease
+        self.batch_size = batch_size
+        self.claimed = 0
+        self.reclaimed = 0
+        self.completed = 0
+        self._heartbeat = None
+        self._stop = threading.Event()
+
+    def _commit(self, session, action):
+        try:
+            session.commit()
+            return True
+        except Exception as e:
+            print("Caught Exception on frontier {0}: {1}".format(action, str(e)))
+            session.rollback()
+            return False
+
+    def push(self, items, due_at=None):
+        """
+            @items: iterable of (dot number, page type)
+            items already in the frontier are left as they are
+        """
+        due_at = due_at or datetime.utcnow()
+        rows = [{'dot_number': dot_number, 'page_type': page_type, 'due_at': due_at, 'attempts': 0}
+                for dot_number, page_type in items]
+        if not rows:
+            return
+        self.shard.execute(insert(FrontierItem.__table__).values(rows).on_conflict_do_nothing())
+        self._commit(self.shard, 'push')
+
+    def push_due(self, scheduler, limit=10000):
+        """ move the pages a RecrawlScheduler has due into the frontier """
+        self.push(scheduler.due(limit))
+
+    def claim(self, size=None):
+        """
+            lease up to @size free or expired items to this worker
+            returns a list of (dot number, page type), earliest due first
+        """
+        now = datetime.utcnow()
+        items = self.shard.query(FrontierItem).filter(
+            FrontierItem.due_at <= now,
+            or_(FrontierItem.lease_owner.is_(None), FrontierItem.lease_expires < now)
+        ).order_by(FrontierItem.due_at).limit(size or self.batch_size).with_for_update(skip_locked=True).all()
+
+        claimed = []
+        for item in items:
+            if item.lease_owner is not None:
+                # its worker stopped sending heartbeats
+                self.reclaimed += 1
+            item.lease_owner = self.worker_id
+            item.lease_expires = now + self.lease
+            item.attempts += 1
+            claimed.append((item.dot_number, item.page_type))
+        if not self._commit(self.shard, 'claim'):
+            return []
+        self.claimed += len(claimed)
+        return claimed
+
+    def _owned(self, session, dot_number=None, page_type=None):
+        query = session.query(FrontierItem).filter(FrontierItem.lease_owner == self.worker_id)
+        if dot_number is not None:
+            query = query.filter(FrontierItem.dot_number == dot_number, FrontierItem.page_type == page_type)
+        return query
+
+    def heartbeat(self, session=None):
+        """
+            extend the lease of every item this worker holds
+            returns the number of items still held
+        """
+        session = session or self.shard
+        held = self._owned(session).update({'lease_expires': datetime.utcnow() + self.lease},
+                                           synchronize_session=False)
+        return held if self._commit(session, 'heartbeat') else 0
+
+    def complete(self, dot_number, page_type):
+        """ remove a crawled item, if this worker still holds it """
+        done = self._owned(self.shard, dot_number, page_type).delete(synchronize_session=False)
+        if self._commit(self.shard, 'complete'):
+            self.completed += done
+
+    def release(self, dot_number, page_type, retry_at=None):
+        """ give an item back for another worker, due again @retry_at or now """
+        self._owned(self.shard, dot_number, page_type).update({
+            'lease_owner': None,
+            'lease_expires': None,
+            'due_at': retry_at or datetime.utcnow()
+        }, synchronize_session=False)
+        self._commit(self.shard, 'release')
+
+    def start_heartbeat(self, interval=None):
+        """
+            send heartbeats from a background thread,
+            a third of the lease apart unless @interval seconds are given
+        """
+        if self._heartbeat is not None:
+            return
+        interval = interval or self.lease.total_seconds() / 3
+        self._stop.clear()
+        self._heartbeat = threading.Thread(target=self._beat, args=(interval,), daemon=True)
+        self._heartbeat.start()
+
+    def _beat(self, interval):
+        # sessions are not shared between threads
+        session = Shard(self.shard.uuid, self.shard.db_name, join_transaction=False)
+        try:
+            while not self._stop.wait(interval):
+                self.heartbeat(session)
+        finally:
+            session.close()
+
+    def stop_heartbeat(self):
+        if self._heartbeat is None:
+            return
+        self._stop.set()
+        self._heartbeat.join()
+        self._heartbeat = None
+
+    def stats(self):
+        return {
+            'claimed': self.claimed,
+            'reclaimed': self.reclaimed,
+            'completed': self.completed
+        }
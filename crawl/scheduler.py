@@ -0,0 +1,138 @@
+import math
+from collections import deque
+from datetime import datetime, timedelta
+from sqlalchemy import Column, DateTime, Float, Integer, String
+from scraper.models import BaseModel
+
+
+class CrawlSchedule(BaseModel):
+    """
+        ORM definition for the change history of one page of one carrier
+        @page_type: __tablename__ of the report the page is saved as
+    """
+    __tablename__ = 'crawl_schedule'
+
+    dot_number = Column(String(10), primary_key=True)
+    page_type = Column(String(32), primary_key=True)
+    checks = Column(Integer, nullable=False, default=0)
+    changes = Column(Integer, nullable=False, default=0)
+    observed_days = Column(Float, nullable=False, default=0.0)
+    last_crawled = Column(DateTime)
+    last_changed = Column(DateTime)
+    next_due = Column(DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        """ used for debugging """
+        return "<CrawlSchedule(dot_number={0}, page_type={1}, next_due={2})>".format(
+            self.dot_number, self.page_type, self.next_due)
+
+
+class RecrawlScheduler:
+    """
+        decides when each carrier page is crawled again
+        from how often it changed when it was crawled before
+        @shard: Shard for the fmcsa schema
+        @min_interval, @max_interval: timedelta bounds of the recrawl interval
+        @initial_interval: timedelta before the first recheck of a new page
+        @changes_per_visit: expected changes between two crawls,
+            lower keeps pages fresher at the cost of more requests
+
+        the change rate is changes per day over the time the page was watched,
+        a crawl only sees whether the page changed at least once, so the count
+        of changes is corrected as in Cho and Garcia-Molina,
+        plus one change over initial_interval as a prior so a page
+        that has not been seen changing yet backs off gradually
+    """
+    DEFAULT_MIN_INTERVAL = timedelta(days=1)
+    DEFAULT_MAX_INTERVAL = timedelta(days=90)
+    DEFAULT_INITIAL_INTERVAL = timedelta(days=7)
+    DEFAULT_CHANGES_PER_VISIT = 0.5
+
+    def __init__(self, shard, min_interval=DEFAULT_MIN_INTERVAL, max_interval=DEFAULT_MAX_INTERVAL,
+                 initial_interval=DEFAULT_INITIAL_INTERVAL, changes_per_visit=DEFAULT_CHANGES_PER_VISIT):
+        self.shard = shard
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.initial_interval = initial_interval
+        self.changes_per_visit = changes_per_visit
+        self.observed = 0
+        self.changed = 0
+
+    def change_rate(self, checks, changes, observed_days):
+        """ estimated changes per day """
+        if checks and changes >= checks:
+            # changed on every visit, the estimator diverges
+            changes = checks - 0.5
+        corrected = -checks * math.log((checks - changes + 0.5) / (checks + 0.5)) if checks else 0.0
+        prior_days = self.initial_interval.total_seconds() / 86400
+        return (corrected + 1) / (observed_days + prior_days)
+
+    def interval(self, entry):
+        days = self.changes_per_visit / self.change_rate(entry.checks, entry.changes, entry.observed_days)
+        return min(self.max_interval, max(self.min_interval, timedelta(days=days)))
+
+    def _entry(self, shard, dot_number, page_type):
+        return shard.query(CrawlSchedule).filter(CrawlSchedule.dot_number == dot_number,
+                                                 CrawlSchedule.page_type == page_type).first()
+
+    def observe(self, dot_number, page_type, changed, shard=None, now=None):
+        """
+            record a crawl of a page and schedule the next one
+            @changed: the crawl wrote a new version of the report
+            @shard: session to add the entry to, the manager passes its own
+                so the entry is committed with the report
+        """
+        shard = shard or self.shard
+        now = now or datetime.utcnow()
+        entry = self._entry(shard, dot_number, page_type)
+        if entry is None:
+            # first sight of the page, nothing to compare with yet
+            entry = CrawlSchedule(dot_number=dot_number, page_type=page_type,
+                                  checks=0, changes=0, observed_days=0.0, last_changed=now)
+            shard.add(entry)
+        elif entry.last_crawled is not None:
+            entry.checks += 1
+            entry.observed_days += (now - entry.last_crawled).total_seconds() / 86400
+            if changed:
+                entry.changes += 1
+                entry.last_changed = now
+        entry.last_crawled = now
+        entry.next_due = now + self.interval(entry)
+
+        self.observed += 1
+        if changed:
+            self.changed += 1
+        return entry.next_due
+
+    def schedule(self, dot_number, page_type, at=None):
+        """
+            queue a page that has never been crawled, due @at or now
+            pages already known keep their schedule
+        """
+        if self._entry(self.shard, dot_number, page_type) is not None:
+            return
+        self.shard.add(CrawlSchedule(dot_number=dot_number, page_type=page_type, checks=0, changes=0,
+                                     observed_days=0.0, next_due=at or datetime.utcnow()))
+        try:
+            self.shard.commit()
+        except Exception as e:
+            print("Caught Exception scheduling {0} {1}: {2}".format(dot_number, page_type, str(e)))
+            self.shard.rollback()
+
+    def due(self, limit=1000, page_types=None, now=None):
+        """
+            returns a deque of (dot number, page type) due by @now,
+            longest overdue first
+            @page_types: only these page types
+        """
+        query = self.shard.query(CrawlSchedule.dot_number, CrawlSchedule.page_type).filter(
+            CrawlSchedule.next_due <= (now or datetime.utcnow()))
+        if page_types:
+            query = query.filter(CrawlSchedule.page_type.in_(page_types))
+        return deque(query.order_by(CrawlSchedule.next_due).limit(limit))
+
+    def stats(self):
+        return {
+            'observed': self.observed,
+            'changed': self.changed
+        }
@@ -16,3 +16,7 @@ class InactiveRecord(Exception):
 
 class TimeoutError(Exception):
     pass
+
+
+class CircuitOpen(Exception):
+    pass
@@ -0,0 +1,414 @@
+import random
+import re
+import threading
+from collections import Counter
+from html import unescape
+from lxml import etree
+from .extraction_plan import split_path
+from .html_parser import ENCODING, thread_parser
+from .scraper_property import ScraperProperty
+
+
+def page_properties(page_cls):
+    """ {name: ScraperProperty} of @page_cls and its bases """
+    found = {}
+    for cls in reversed(page_cls.__mro__):
+        for name, value in vars(cls).items():
+            if isinstance(value, ScraperProperty):
+                found[name] = value
+    return found
+
+
+class ExtractionBackend:
+    """
+        extracts the ScraperProperty values of a page
+        set as BasePage.extraction_backend, the first descriptor read
+        calls fill() and the fields it leaves out are read by their descriptor
+
+        fields: names of the properties fill() extracts
+    """
+    name = None
+    fields = ()
+
+    def fill(self, page, extracted):
+        """
+            put the values of @page's fields in @extracted,
+            fields that raise are left out
+        """
+        raise NotImplementedError
+
+    def can_fill(self, page):
+        """ False when @page lacks what fill() reads """
+        return True
+
+
+class LxmlBackend(ExtractionBackend):
+    """
+        the parsed tree, through the page's ExtractionPlan when it has one,
+        else each descriptor's xpath, what pages do without a backend
+    """
+    name = 'lxml'
+
+    def __init__(self, page_cls):
+        self.properties = page_properties(page_cls)
+        self.fields = tuple(self.properties)
+
+    def fill(self, page, extracted):
+        plan = getattr(page, 'extraction_plan', None)
+        if plan is not None:
+            plan.fill(page, extracted)
+            return
+        for name, prop in self.properties.items():
+            try:
+                extracted[name] = prop.extract(page)
+            except (ValueError, IndexError):
+                pass
+
+
+# tags, comments, doctype and processing instructions, text is skipped over,
+# {0} are the tags skipped as well
+TAG = rb'<(/?)(?!(?:{0})[\s/>])([A-Za-z][A-Za-z0-9]*)((?:[^>"\']|"[^"]*"|\'[^\']*\')*)>|<!--.*?-->|<[!?][^>]*>'
+ATTRIBUTE = re.compile(rb'([A-Za-z_:][-\w:.]*)\s*=\s*("[^"]*"|\'[^\']*\'|[^\s>]+)')
+STEP = re.compile(r'^(\w+)(?:\[(\d+)\]|\[@(\w+)="([^"]*)"\])?$')
+MARKUP = re.compile(r'<[^>]*>')
+VOID = frozenset(['area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'param', 'wbr'])
+RAW_TEXT = frozenset(['script', 'style'])
+# text level tags that never hold a table, skipped unless a path names them
+INLINE = frozenset(['a', 'abbr', 'b', 'br', 'em', 'i', 'img', 'input', 'label', 'option', 'select',
+                    'small', 'span', 'strong', 'sub', 'sup', 'textarea', 'u', 'wbr'])
+# open elements an opening tag closes, as the HTML parser does
+CLOSES = {
+    'td': frozenset(['td', 'th']),
+    'th': frozenset(['td', 'th']),
+    'tr': frozenset(['td', 'th', 'tr']),
+    'p': frozenset(['p']),
+    'li': frozenset(['li']),
+    'option': frozenset(['option'])
+}
+
+
+class Frame:
+    """
+        an open element while TokenBackend scans a page
+        @states: (path, step) pairs this element matched,
+            or inherited from an ancestor for a // step
+    """
+    __slots__ = ('tag', 'start', 'counts', 'states', 'hits', 'label', 'after_label')
+
+    def __init__(self, tag, start, states):
+        self.tag = tag
+        self.start = start
+        self.counts = {}
+        self.states = states
+        self.hits = []
+        self.label = None
+        self.after_label = None
+
+
+class TokenBackend(ExtractionBackend):
+    """
+        finds each field's elements with a scan of the page's tags,
+        no tree of the page is built
+        only the few elements selected are parsed, on their own,
+        and passed to the property as its xpath result would be
+
+        @page_cls: page whose properties are extracted
+        @labels: as for ExtractionPlan, the cell next to a th label
+            is used when the label is on the page
+
+        takes paths made of tag, tag[n] and tag[@name="value"] steps,
+        ending in an element or text(), the other properties are left
+        to their descriptor
+        meant for the machine generated SAFER and LI layouts,
+        run it in a ShadowBackend before relying on it
+    """
+    name = 'tokens'
+
+    def __init__(self, page_cls, labels=None):
+        self.properties = {}
+        self.paths = []
+        self.labels = {}
+        for name, prop in page_properties(page_cls).items():
+            path = self._compile(prop.expr)
+            if path is not None:
+                self.properties[name] = prop
+                self.paths.append((name,) + path)
+        for name, label in (labels or {}).items():
+            if name not in self.properties:
+                continue
+            if isinstance(label, str):
+                self.labels[label] = (name, None)
+            else:
+                self.labels[label[0]] = (name, etree.XPath(label[1], smart_strings=False))
+        self.fields = tuple(self.properties)
+        # paths by the tag of their first step, tried on every element
+        self.first = {}
+        named = set()
+        for index, (name, steps, text) in enumerate(self.paths):
+            self.first.setdefault(steps[0][1], []).append(index)
+            named.update(step[1] for step in steps)
+        skipped = '|'.join(sorted(INLINE - named)).encode(ENCODING) or b'(?!)'
+        self.tag = re.compile(TAG.replace(b'{0}', skipped), re.S | re.I)
+
+    @staticmethod
+    def _compile(expr):
+        """
+            returns ([(descendant, tag, position, attribute, value)], text xpath or None)
+            or None when @expr has a step the scan cannot follow
+        """
+        steps = split_path(expr)
+        if steps is None:
+            return None
+        text = None
+        if steps[-1][1] == 'text()':
+            text = etree.XPath('text()', smart_strings=False)
+            steps = steps[:-1]
+        compiled = []
+        for separator, step in steps:
+            m = STEP.match(step)
+            if m is None:
+                return None
+            tag, position, attribute, value = m.groups()
+            compiled.append((separator == '//', tag.lower(), int(position) if position else None, attribute, value))
+        if not compiled or not compiled[0][0]:
+            return None
+        return compiled, text
+
+    def _element(self, html, start, end):
+        """ the element at html[start:end], parsed on its own """
+        root = etree.fromstring(html[start:end], thread_parser())
+        if root is None:
+            return None
+        body = root.find('body')
+        container = body if body is not None and len(body) else root.find('head')
+        if container is None or not len(container):
+            return None
+        return container[0]
+
+    @staticmethod
+    def _attributes(raw):
+        return {name.decode(ENCODING).lower(): value.strip(b'"\'').decode(ENCODING)
+                for name, value in ATTRIBUTE.findall(raw)}
+
+    def _matches(self, step, tag, position, raw):
+        descendant, step_tag, step_position, attribute, value = step
+        if step_tag != tag:
+            return False
+        if step_position is not None and step_position != position:
+            return False
+        if attribute is not None:
+            return self._attributes(raw).get(attribute) == value
+        return True
+
+    def spans(self, html):
+        """
+            @html: page bytes
+            returns ({path index: [(start, end)] in document order},
+                     {label: (start, end) of the cell next to it})
+        """
+        hits = {}
+        labelled = set()
+        cells = {}
+        stack = [Frame(None, 0, ())]
+        opened = Counter()
+        position = 0
+        paths = self.paths
+        first = self.first
+        labels = self.labels
+
+        def close(frame, end):
+            opened[frame.tag] -= 1
+            for index in frame.hits:
+                hits.setdefault(index, []).append((frame.start, end))
+            if frame.label is not None:
+                cells[frame.label] = (frame.start, end)
+            if frame.tag == 'th' and labels:
+                # the text of every node below the th, as itertext() gives it
+                text = unescape(MARKUP.sub('', html[frame.start:end].decode(ENCODING)))
+                stack[-1].after_label = ' '.join(text.split())
+
+        while True:
+            m = self.tag.search(html, position)
+            if m is None:
+                break
+            position = m.end()
+            closing, tag, raw = m.groups()
+            if tag is None:
+                continue
+            tag = tag.decode(ENCODING).lower()
+            if closing:
+                if opened[tag]:
+                    while True:
+                        frame = stack.pop()
+                        close(frame, position if frame.tag == tag else m.start())
+                        if frame.tag == tag:
+                            break
+                continue
+
+            closes = CLOSES.get(tag)
+            while closes and stack[-1].tag in closes:
+                close(stack.pop(), m.start())
+            parent = stack[-1]
+            counts = parent.counts
+            count = counts[tag] = counts.get(tag, 0) + 1
+
+            if parent.states or tag in first:
+                states = set()
+                for index in first.get(tag, ()):
+                    if self._matches(paths[index][1][0], tag, count, raw):
+                        states.add((index, 0))
+                for index, step in parent.states:
+                    steps = paths[index][1]
+                    if step + 1 < len(steps):
+                        following = steps[step + 1]
+                        if following[0]:
+                            # a // step, still open below this element
+                            states.add((index, step))
+                        if self._matches(following, tag, count, raw):
+                            states.add((index, step + 1))
+                frame = Frame(tag, m.start(), states)
+                for index, step in states:
+                    if step == len(paths[index][1]) - 1:
+                        frame.hits.append(index)
+            else:
+                # nothing below a page's unrelated elements but // steps
+                frame = Frame(tag, m.start(), ())
+            if parent.after_label is not None:
+                if tag == 'td' and parent.after_label in labels and parent.after_label not in labelled:
+                    # the first cell wins when a label repeats
+                    frame.label = parent.after_label
+                    labelled.add(frame.label)
+                parent.after_label = None
+
+            if tag in VOID or raw.rstrip().endswith(b'/'):
+                end = position
+            elif tag in RAW_TEXT:
+                end_tag = re.compile(b'</' + tag.encode(ENCODING) + rb'\s*>', re.I).search(html, position)
+                end = position = end_tag.end() if end_tag else len(html)
+            else:
+                opened[tag] += 1
+                stack.append(frame)
+                continue
+            for index in frame.hits:
+                hits.setdefault(index, []).append((frame.start, end))
+        while len(stack) > 1:
+            close(stack.pop(), len(html))
+        return {index: sorted(found) for index, found in hits.items()}, cells
+
+    def can_fill(self, page):
+        # streamed pages only have their tree
+        return bool(getattr(page, 'html_body', None))
+
+    def fill(self, page, extracted):
+        if not self.can_fill(page):
+            return
+        html = page.html_body
+        hits, cells = self.spans(html)
+        nodes = {}
+        for label, (start, end) in cells.items():
+            name, select = self.labels[label]
+            cell = self._element(html, start, end)
+            if cell is not None:
+                nodes[name] = [cell] if select is None else select(cell)
+        for index, (name, steps, text) in enumerate(self.paths):
+            if name in nodes:
+                continue
+            elements = [self._element(html, start, end) for start, end in hits.get(index, [])]
+            elements = [element for element in elements if element is not None]
+            if text is not None:
+                elements = [item for element in elements for item in text(element)]
+            nodes[name] = elements
+        for name, found in nodes.items():
+            try:
+                extracted[name] = self.properties[name].from_nodes(found)
+            except (ValueError, IndexError):
+                pass
+
+
+class ShadowBackend(ExtractionBackend):
+    """
+        pages get @primary's values, a @sample share of them is also
+        extracted by @candidate and the fields both extract are compared
+        @max_examples: disagreements kept for report()
+        @seed: of the sampling
+        pages @candidate cannot fill, e.g. TokenBackend on a streamed
+        page with no html_body, are not sampled and count as skipped
+
+        counts are kept on this object in this process: use it where
+        the pages are extracted, threads or an AsyncFetcher crawl;
+        ParsePool workers extract with their own copy and those
+        counts never come back
+    """
+    name = 'shadow'
+    MISSING = '<missing>'
+
+    def __init__(self, primary, candidate, sample=0.01, max_examples=100, seed=None):
+        self.primary = primary
+        self.candidate = candidate
+        self.sample = sample
+        self.max_examples = max_examples
+        self.fields = primary.fields
+        self.pages = 0
+        self.sampled = 0
+        self.disagreeing = 0
+        self.errors = 0
+        self.skipped = 0
+        self.disagreements = Counter()
+        self.examples = []
+        self._compared = [name for name in primary.fields if name in set(candidate.fields)]
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def can_fill(self, page):
+        return self.primary.can_fill(page)
+
+    def fill(self, page, extracted):
+        self.primary.fill(page, extracted)
+        with self._lock:
+            self.pages += 1
+            if not self.candidate.can_fill(page):
+                self.skipped += 1
+                return
+            if self._random.random() >= self.sample:
+                return
+            self.sampled += 1
+        shadow = {}
+        try:
+            self.candidate.fill(page, shadow)
+        except Exception as e:
+            print("Caught Exception in shadow extraction of {0}: {1}".format(page.dot_number, str(e)))
+            with self._lock:
+                self.errors += 1
+            return
+        differences = {}
+        for name in self._compared:
+            value = extracted.get(name, self.MISSING)
+            candidate = shadow.get(name, self.MISSING)
+            if value != candidate:
+                differences[name] = (value, candidate)
+        if not differences:
+            return
+        with self._lock:
+            self.disagreeing += 1
+            self.disagreements.update(differences.keys())
+            for name, (value, candidate) in differences.items():
+                if len(self.examples) < self.max_examples:
+                    self.examples.append((type(page).__name__, page.dot_number, name, value, candidate))
+
+    def report(self):
+        """ (page, dot number, field, primary value, candidate value) kept so far """
+        with self._lock:
+            return list(self.examples)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'primary': self.primary.name,
+                'candidate': self.candidate.name,
+                'pages': self.pages,
+                'sampled': self.sampled,
+                'disagreeing': self.disagreeing,
+                'errors': self.errors,
+                'skipped': self.skipped,
+                'fields': dict(self.disagreements)
+            }
@@ -0,0 +1,229 @@
+import threading
+from collections import Counter
+from lxml import etree
+from .scraper_property import ScraperProperty
+
+
+def split_path(expr):
+    """
+        @expr: location path like //table/tr[2]/td
+        returns [(separator, step)] e.g. [('//', 'table'), ('/', 'tr[2]'), ('/', 'td')]
+        or None for expressions a plan cannot take apart (unions, functions)
+    """
+    steps = []
+    depth = 0
+    quote = None
+    i = 0
+    start = None
+    while i < len(expr):
+        char = expr[i]
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in '"\'':
+            quote = char
+        elif char == '[':
+            depth += 1
+        elif char == ']':
+            depth -= 1
+        elif char == '|' and not depth:
+            return None
+        elif char == '/' and not depth:
+            if start is not None:
+                steps[-1] = (steps[-1][0], expr[start:i])
+            separator = '//' if expr.startswith('//', i) else '/'
+            steps.append((separator, None))
+            i += len(separator)
+            start = i
+            continue
+        i += 1
+    if not steps or start is None or start == len(expr):
+        return None
+    steps[-1] = (steps[-1][0], expr[start:])
+    return steps
+
+
+def label_index(tree):
+    """
+        one pass over the th cells of @tree
+        returns {label text: the value cell next to it},
+        the first cell wins when a label repeats
+    """
+    index = {}
+    for th in tree.iter('th'):
+        cell = th.getnext()
+        if cell is None or cell.tag != 'td':
+            continue
+        label = ' '.join(''.join(th.itertext()).split())
+        if label and label not in index:
+            index[label] = cell
+    return index
+
+
+class PlanNode:
+    """
+        one step of an ExtractionPlan
+        @xpath: compiled step, relative to each context node
+        @fields: names of the properties whose path ends here
+        @names: the fields of this node and every node below it
+    """
+    def __init__(self, xpath=None):
+        self.xpath = xpath
+        self.children = {}
+        self.fields = []
+        self.names = set()
+
+
+class ExtractionPlan:
+    """
+        the xpaths of a page's properties merged into a trie
+        SaferPage's paths all start with //table/tr[2]/td/table/tr[2]/td/center[N],
+        that prefix and each center[N] is resolved once per page
+        and only the short steps below it per property
+
+        @page_cls: page whose ScraperProperty descriptors are planned
+        @labels: {property name: th label text or (label, relative xpath)},
+            those properties are looked up by the label of their value cell,
+            the relative xpath selects from that cell as the positional one did,
+            the positional path is used when the label is not on the page
+        paths that cannot be split are evaluated whole, as before
+
+        failures counts the fields left out because their cells were
+        missing or malformed, per field, in this process
+    """
+    def __init__(self, page_cls, labels=None):
+        self.root = PlanNode()
+        self.failures = Counter()
+        self._lock = threading.Lock()
+        self.properties = {}
+        self.unplanned = []
+        self.labels = {}
+        for name, label in (labels or {}).items():
+            if isinstance(label, str):
+                self.labels[name] = (label, None)
+            else:
+                self.labels[name] = (label[0], etree.XPath(label[1], smart_strings=False))
+        for cls in reversed(page_cls.__mro__):
+            for name, value in vars(cls).items():
+                if isinstance(value, ScraperProperty):
+                    self.properties[name] = value
+        for name, prop in self.properties.items():
+            steps = split_path(prop.expr)
+            if steps is None:
+                self.unplanned.append(name)
+            else:
+                self._add(name, steps)
+
+    def _add(self, name, steps):
+        node = self.root
+        node.names.add(name)
+        for position, (separator, step) in enumerate(steps):
+            if position == 0:
+                # the first step is absolute, evaluated on the document
+                expr = separator + step
+            else:
+                expr = step if separator == '/' else './/' + step
+            child = node.children.get(expr)
+            if child is None:
+                child = node.children[expr] = PlanNode(etree.XPath(expr, smart_strings=False))
+            node = child
+            node.names.add(name)
+        node.fields.append(name)
+
+    def nodes(self, tree, wanted=None):
+        """
+            @tree: the parsed page
+            @wanted: names to resolve, every property by default
+            returns {property name: the nodes its xpath selects}
+            in the same order the whole xpath would give them,
+            labelled properties come from their value cell
+        """
+        found = {}
+        order = {}
+        wanted = set(self.properties if wanted is None else wanted)
+
+        if self.labels:
+            index = label_index(tree)
+            for name, (label, select) in self.labels.items():
+                cell = index.get(label)
+                if name in wanted and cell is not None:
+                    found[name] = [cell] if select is None else select(cell)
+                    wanted.discard(name)
+
+        def in_document_order(items):
+            if not order:
+                order.update((element, i) for i, element in enumerate(tree.iter()))
+            return sorted(items, key=order.__getitem__)
+
+        def walk(node, contexts):
+            for child in node.children.values():
+                if not child.names & wanted:
+                    continue
+                items = []
+                seen = set()
+                for context in contexts:
+                    for item in child.xpath(context):
+                        if isinstance(item, etree._Element):
+                            if item in seen:
+                                continue
+                            seen.add(item)
+                        items.append(item)
+                if len(contexts) > 1 and len(items) > 1 and len(seen) == len(items):
+                    # nested contexts can select nodes out of document order
+                    items = in_document_order(items)
+                for name in child.fields:
+                    if name in wanted:
+                        found[name] = items
+                elements = [item for item in items if isinstance(item, etree._Element)]
+                if elements and child.children:
+                    walk(child, elements)
+
+        if self.root.names & wanted:
+            walk(self.root, [tree])
+            for name in self.root.names & wanted:
+                # a step on the way selected nothing
+                found.setdefault(name, [])
+        for name in self.unplanned:
+            if name in wanted:
+                found[name] = self.properties[name].xpath(tree)
+        return found
+
+    def fill(self, page, extracted):
+        """
+            put every property value of @page in @extracted,
+            properties that raise are left out and raise when read
+        """
+        failed = []
+        for name, nodes in self.nodes(page.root).items():
+            try:
+                extracted[name] = self.properties[name].from_nodes(nodes)
+            except (ValueError, IndexError):
+                # a bad value, or a table or cell the page does not have
+                failed.append(name)
+        if failed:
+            with self._lock:
+                self.failures.update(failed)
+
+    def stats(self):
+        """ {field: times it was left out} """
+        with self._lock:
+            return dict(self.failures)
+
+    def verify(self, page):
+        """
+            compare the planned values of @page to each property's own
+            returns {name: (planned, expected)} for the ones that differ
+        """
+        planned = {}
+        self.fill(page, planned)
+        differences = {}
+        for name, prop in self.properties.items():
+            try:
+                expected = prop.extract(page)
+            except Exception as e:
+                if name in planned:
+                    differences[name] = (planned[name], type(e).__name__)
+                continue
+            if name not in planned or planned[name] != expected:
+                differences[name] = (planned.get(name), expected)
+        return differences
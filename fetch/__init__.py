@@ -0,0 +1,23 @@
+from .async_fetcher import AsyncFetcher
+from .pool import AsyncConnectionPool, ConnectionPool, PoolStats
+from .rate_limit import AIMD, AsyncHostLimiter, HostLimiter, RateLimits, TokenBucket
+from .replay import Corpus, Recorder, ReplayServer
+from .retry import CircuitBreaker, RetryPolicy
+
+
+__all__ = [
+    AIMD,
+    AsyncConnectionPool,
+    AsyncFetcher,
+    AsyncHostLimiter,
+    CircuitBreaker,
+    ConnectionPool,
+    Corpus,
+    HostLimiter,
+    PoolStats,
+    RateLimits,
+    Recorder,
+    ReplayServer,
+    RetryPolicy,
+    TokenBucket
+]
@@ -0,0 +1,89 @@
+import asyncio
+import time
+from .http11 import split_url
+from .pool import AsyncConnectionPool
+from .rate_limit import is_overload
+
+
+class AsyncFetcher:
+    """
+        asyncio counterpart of BasePage._get_html
+        keeps many requests in flight at once
+        @max_per_host: cap on concurrent requests to one host
+        @max_in_flight: cap on concurrent requests overall
+        @pool: AsyncConnectionPool, by default one sized to max_per_host
+        @limits: optional RateLimits of AsyncHostLimiter,
+            replaces the fixed max_per_host cap with a paced adaptive one
+
+        one fetcher is meant to be shared by every page of a crawl
+        so the per host cap and the keep-alive connections
+        hold across page types
+    """
+    DEFAULT_MAX_PER_HOST = 16
+    DEFAULT_MAX_IN_FLIGHT = 256
+
+    def __init__(self, max_per_host=DEFAULT_MAX_PER_HOST, max_in_flight=DEFAULT_MAX_IN_FLIGHT, pool=None,
+                 limits=None):
+        self.max_per_host = max_per_host
+        self.max_in_flight = max_in_flight
+        self.pool = pool if pool is not None else AsyncConnectionPool(max_per_host=max_per_host)
+        self.limits = limits
+        self._in_flight = asyncio.Semaphore(max_in_flight)
+        self._host_slots = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def _host_slot(self, host):
+        """ one semaphore per host, created on first use """
+        try:
+            return self._host_slots[host]
+        except KeyError:
+            slot = self._host_slots[host] = asyncio.Semaphore(self.max_per_host)
+            return slot
+
+    async def post(self, url, data, timeout, sink=None):
+        """
+            @url: page url
+            @data: url encoded POST body
+            @timeout: seconds for the request itself,
+                time spent waiting for a slot is not counted
+            @sink: optional object with feed(bytes) for the body as it arrives
+            returns the raw body as bytes, b'' when it went to @sink
+            raises HTTPError, URLError or asyncio.TimeoutError
+        """
+        host = split_url(url)[1]
+        async with self._in_flight:
+            if self.limits is None:
+                async with self._host_slot(host):
+                    return await asyncio.wait_for(self.pool.post(url, data, sink), timeout)
+
+            limiter = self.limits.for_host(host)
+            await limiter.acquire()
+            started = time.monotonic()
+            latency, failed = None, False
+            try:
+                body = await asyncio.wait_for(self.pool.post(url, data, sink), timeout)
+                latency = time.monotonic() - started
+            except Exception as error:
+                failed = is_overload(error)
+                raise
+            finally:
+                # a cancelled request is no Exception but must give its slot back,
+                # shielded so a second cancel can't interrupt the release
+                await asyncio.shield(limiter.release(latency=latency, failed=failed))
+            return body
+
+    def stats(self):
+        """ per host connection pool counters """
+        return self.pool.stats.snapshot()
+
+    def limit_stats(self):
+        """ per host limiter state, empty without limits """
+        return self.limits.stats() if self.limits is not None else {}
+
+    def close(self):
+        self.pool.close()
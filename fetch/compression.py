@@ -0,0 +1,52 @@
+import zlib
+
+
+ACCEPT_ENCODING = 'gzip, deflate'
+
+
+class Decoder:
+    """
+        incremental decoder for a Content-Encoding
+        @encoding: gzip, deflate or None/identity
+
+        deflate is sent zlib wrapped by most servers and raw by some,
+        the first bytes tell which
+    """
+    def __init__(self, encoding=None):
+        self.encoding = (encoding or 'identity').strip().lower()
+        if self.encoding in ('gzip', 'x-gzip'):
+            self._inflate = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        else:
+            self._inflate = None
+        self._pending = b''
+
+    @property
+    def identity(self):
+        return self.encoding not in ('gzip', 'x-gzip', 'deflate')
+
+    def decode(self, chunk):
+        if self.identity:
+            return chunk
+        if self._inflate is None:
+            # deflate: wait for the two header bytes
+            self._pending += chunk
+            if len(self._pending) < 2:
+                return b''
+            chunk, self._pending = self._pending, b''
+            self._inflate = zlib.decompressobj(zlib.MAX_WBITS if self._zlib_header(chunk) else -zlib.MAX_WBITS)
+        return self._inflate.decompress(chunk)
+
+    def flush(self):
+        if self.identity:
+            return b''
+        if self._inflate is None:
+            if not self._pending:
+                return b''
+            self._inflate = zlib.decompressobj(-zlib.MAX_WBITS)
+            chunk, self._pending = self._pending, b''
+            return self._inflate.decompress(chunk) + self._inflate.flush()
+        return self._inflate.flush()
+
+    @staticmethod
+    def _zlib_header(data):
+        return data[0] & 0x0f == 8 and (data[0] << 8 | data[1]) % 31 == 0
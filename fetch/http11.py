@@ -0,0 +1,127 @@
+import asyncio
+from urllib.parse import urlsplit
+
+
+class Response:
+    """
+        minimal HTTP/1.1 response
+        @status: integer status code
+        @reason: status text
+        @headers: dict of lower cased header names
+        @body: raw bytes of the body
+    """
+    def __init__(self, status, reason, headers, body=b''):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+
+    def __repr__(self):
+        return "<Response(status={0}, length={1})>".format(self.status, len(self.body))
+
+
+def split_url(url):
+    """
+        @url: absolute http or https url
+        returns (scheme, host, port, path)
+        path includes the query string
+    """
+    parts = urlsplit(url)
+    scheme = parts.scheme or 'http'
+    port = parts.port or (443 if scheme == 'https' else 80)
+    path = parts.path or '/'
+    if parts.query:
+        path = '{0}?{1}'.format(path, parts.query)
+    return scheme, parts.hostname, port, path
+
+
+def build_request(method, host, path, data=None, headers=None):
+    """
+        @method: GET or POST
+        @data: url encoded body for POST
+        @headers: extra headers
+        returns the request as bytes
+    """
+    lines = ['{0} {1} HTTP/1.1'.format(method, path), 'Host: {0}'.format(host)]
+    all_headers = {'User-Agent': 'Python-urllib', 'Accept': '*/*'}
+    if headers:
+        all_headers.update(headers)
+    if data is not None:
+        all_headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        all_headers['Content-Length'] = str(len(data))
+    for name, value in all_headers.items():
+        lines.append('{0}: {1}'.format(name, value))
+    head = ('\r\n'.join(lines) + '\r\n\r\n').encode('ISO-8859-1')
+    return head + (data or b'')
+
+
+async def read_head(reader):
+    """
+        read the status line and headers
+        returns (status, reason, headers)
+    """
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionResetError("connection closed before response")
+    parts = status_line.decode('ISO-8859-1').rstrip('\r\n').split(' ', 2)
+    status = int(parts[1])
+    reason = parts[2] if len(parts) > 2 else ''
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('ISO-8859-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    return status, reason, headers
+
+
+async def iter_body(reader, headers, chunk_size=64 * 1024):
+    """
+        async generator over the body of a response
+        handles chunked, content-length and read-until-close bodies
+    """
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        while True:
+            line = await reader.readline()
+            size = int(line.split(b';', 1)[0].strip() or b'0', 16)
+            if size == 0:
+                # skip trailers
+                while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                return
+            yield await reader.readexactly(size)
+            await reader.readline()
+    elif 'content-length' in headers:
+        remaining = int(headers['content-length'])
+        while remaining > 0:
+            chunk = await reader.read(min(chunk_size, remaining))
+            if not chunk:
+                raise asyncio.IncompleteReadError(chunk, remaining)
+            remaining -= len(chunk)
+            yield chunk
+    else:
+        while True:
+            chunk = await reader.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+async def read_response(reader):
+    """
+        read a whole response from @reader
+        returns a Response
+    """
+    status, reason, headers = await read_head(reader)
+    body = []
+    if has_body(status):
+        async for chunk in iter_body(reader, headers):
+            body.append(chunk)
+    return Response(status, reason, headers, b''.join(body))
+
+
+def has_body(status):
+    """ 1xx, 204 and 304 responses never carry a body """
+    return not (100 <= status < 200 or status in (204, 304))
@@ -0,0 +1,453 @@
+import asyncio
+import ssl
+import threading
+import time
+from collections import deque
+from http.client import HTTPConnection, HTTPSConnection, HTTPException
+from socket import timeout as sock_timeout
+from urllib.error import HTTPError, URLError
+from urllib.parse import urljoin
+from .compression import ACCEPT_ENCODING, Decoder
+from .http11 import Response, build_request, has_body, iter_body, read_head, split_url
+from .rate_limit import is_overload
+
+
+class HostStats:
+    """
+        usage counters for one host's connections
+        created: new connections opened
+        reused: requests sent on an idle connection
+        evicted: idle connections closed for being idle too long
+        discarded: connections closed instead of returned to the pool
+        in_use: connections currently checked out
+        idle: connections waiting in the pool
+        wire_bytes: body bytes received, compressed or not
+        decoded_bytes: body bytes after decompression
+    """
+    FIELDS = ('created', 'reused', 'evicted', 'discarded', 'in_use', 'idle', 'wire_bytes', 'decoded_bytes')
+
+    def __init__(self):
+        for name in self.FIELDS:
+            setattr(self, name, 0)
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+
+class PoolStats:
+    def __init__(self):
+        self.hosts = {}
+
+    def __getitem__(self, host):
+        try:
+            return self.hosts[host]
+        except KeyError:
+            stats = self.hosts[host] = HostStats()
+            return stats
+
+    def snapshot(self):
+        """ returns {host: {counter: value}} """
+        return {host: stats.as_dict() for host, stats in self.hosts.items()}
+
+
+class FedSink:
+    """
+        passes body bytes on to @sink and remembers whether any went through,
+        a request whose body already reached the sink cannot be retried
+    """
+    def __init__(self, sink):
+        self.sink = sink
+        self.fed = False
+
+    def feed(self, data):
+        self.fed = True
+        self.sink.feed(data)
+
+
+class BasePool:
+    """
+        bookkeeping shared by the blocking and asyncio pools
+        @max_per_host: idle connections kept per host,
+            busier hosts get extra connections that are closed after use
+        @idle_timeout: seconds an idle connection may sit before it is evicted
+        @compress: ask for gzip or deflate bodies and decode them as they arrive
+    """
+    DEFAULT_MAX_PER_HOST = 8
+    DEFAULT_IDLE_TIMEOUT = 30
+    MAX_REDIRECTS = 5
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, max_per_host=DEFAULT_MAX_PER_HOST, idle_timeout=DEFAULT_IDLE_TIMEOUT, compress=True):
+        self.max_per_host = max_per_host
+        self.idle_timeout = idle_timeout
+        self.compress = compress
+        self.stats = PoolStats()
+        self._idle = {}
+
+    def _key(self, scheme, host, port):
+        return (scheme, host, port)
+
+    def _host_name(self, key):
+        return '{0}://{1}:{2}'.format(*key)
+
+    def _pop_idle(self, key):
+        """
+            newest idle connection for @key or None
+            stale connections found on the way are evicted
+        """
+        idle = self._idle.get(key)
+        stats = self.stats[self._host_name(key)]
+        now = time.monotonic()
+        while idle:
+            conn, last_used = idle.pop()
+            stats.idle -= 1
+            if now - last_used <= self.idle_timeout:
+                return conn
+            self._close(conn)
+            stats.evicted += 1
+        return None
+
+    def _push_idle(self, key, conn):
+        """ returns False when the pool for @key is full """
+        idle = self._idle.setdefault(key, deque())
+        if len(idle) >= self.max_per_host:
+            return False
+        idle.append((conn, time.monotonic()))
+        self.stats[self._host_name(key)].idle += 1
+        return True
+
+    def _evict(self, now):
+        for key, idle in self._idle.items():
+            stats = self.stats[self._host_name(key)]
+            while idle and now - idle[0][1] > self.idle_timeout:
+                conn, _ = idle.popleft()
+                self._close(conn)
+                stats.idle -= 1
+                stats.evicted += 1
+
+    def _close_all(self):
+        for key, idle in self._idle.items():
+            stats = self.stats[self._host_name(key)]
+            while idle:
+                conn, _ = idle.popleft()
+                self._close(conn)
+                stats.idle -= 1
+                stats.discarded += 1
+
+    def _close(self, conn):
+        """ close @conn, an http.client connection unless overridden """
+        conn.close()
+
+    def _redirect(self, url, method, data, response):
+        """
+            urllib semantics: 301, 302 and 303 after a POST become a GET
+            returns (url, method, data) to follow or None
+        """
+        if response.status in (301, 302, 303, 307) and 'location' in response.headers:
+            if response.status != 307:
+                method, data = 'GET', None
+            return urljoin(url, response.headers['location']), method, data
+        return None
+
+    def _encoding_headers(self, headers):
+        all_headers = {'Accept-Encoding': ACCEPT_ENCODING} if self.compress else {}
+        if headers:
+            all_headers.update(headers)
+        return all_headers
+
+    def _streams(self, sink, status):
+        """ only successful bodies go to a sink, errors and redirects are buffered """
+        return sink is not None and 200 <= status < 300
+
+    def _check(self, url, response):
+        if response.status >= 400:
+            raise HTTPError(url, response.status, response.reason, response.headers, None)
+        return response.body
+
+
+class ConnectionPool(BasePool):
+    """
+        blocking keep-alive pool built on http.client
+        safe to share between threads
+        @limits: optional RateLimits of HostLimiter,
+            paces and bounds requests per host
+    """
+    def __init__(self, *args, limits=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.limits = limits
+        self._lock = threading.Lock()
+
+    def post(self, url, data, timeout, sink=None):
+        """
+            @url: page url
+            @data: url encoded POST body
+            @timeout: socket timeout in seconds
+            @sink: optional object with feed(bytes),
+                gets the body chunk by chunk as it arrives
+            returns the raw body as bytes, b'' when it went to @sink
+            raises HTTPError, URLError or socket.timeout
+        """
+        if self.limits is None:
+            return self._post(url, data, timeout, sink)
+
+        limiter = self.limits.for_url(url)
+        limiter.acquire()
+        started = time.monotonic()
+        latency, failed = None, False
+        try:
+            body = self._post(url, data, timeout, sink)
+            latency = time.monotonic() - started
+        except Exception as error:
+            failed = is_overload(error)
+            raise
+        finally:
+            # KeyboardInterrupt and the like give the slot back too
+            limiter.release(latency=latency, failed=failed)
+        return body
+
+    def _post(self, url, data, timeout, sink=None):
+        method = 'POST'
+        for _ in range(self.MAX_REDIRECTS + 1):
+            response = self.request(method, url, data, timeout, sink=sink)
+            follow = self._redirect(url, method, data, response)
+            if follow is None:
+                return self._check(url, response)
+            url, method, data = follow
+        raise HTTPError(url, response.status, "too many redirects", response.headers, None)
+
+    def request(self, method, url, data, timeout, headers=None, sink=None):
+        """
+            send one request on a pooled connection, returns a Response
+            a successful body is fed to @sink instead of the Response when given
+        """
+        scheme, host, port, path = split_url(url)
+        key = self._key(scheme, host, port)
+        stats = self.stats[self._host_name(key)]
+
+        with self._lock:
+            conn = self._pop_idle(key)
+            reused = conn is not None
+            stats.in_use += 1
+        if sink is not None:
+            sink = FedSink(sink)
+
+        try:
+            while True:
+                if conn is None:
+                    conn = self._connect(scheme, host, port, timeout)
+                    with self._lock:
+                        stats.created += 1
+                else:
+                    with self._lock:
+                        stats.reused += 1
+                    conn.timeout = timeout
+                    if conn.sock is not None:
+                        conn.sock.settimeout(timeout)
+                try:
+                    conn.request(method, path, body=data, headers=self._headers(data, headers))
+                    raw = conn.getresponse()
+                    body, wire, decoded = self._read(raw, sink)
+                except sock_timeout:
+                    raise
+                except (HTTPException, OSError) as error:
+                    self._close(conn)
+                    conn = None
+                    if reused and not (sink is not None and sink.fed):
+                        # the server closed an idle keep-alive connection: retry once on a new one,
+                        # unless part of the body already went to the sink
+                        reused = False
+                        continue
+                    raise URLError(error) from error
+                break
+        except BaseException:
+            if conn is not None:
+                self._close(conn)
+            with self._lock:
+                stats.in_use -= 1
+                stats.discarded += 1
+            raise
+
+        response = Response(raw.status, raw.reason,
+                            {name.lower(): value for name, value in raw.getheaders()}, body)
+        with self._lock:
+            stats.wire_bytes += wire
+            stats.decoded_bytes += decoded
+            stats.in_use -= 1
+            if raw.will_close or not self._push_idle(key, conn):
+                self._close(conn)
+                stats.discarded += 1
+        return response
+
+    def _read(self, raw, sink):
+        """
+            read and decode the body of @raw
+            returns (body, wire bytes, decoded bytes),
+            body is b'' when it went to @sink
+        """
+        decoder = Decoder(raw.getheader('content-encoding'))
+        streams = self._streams(sink, raw.status)
+        body = []
+        wire = decoded = 0
+        chunk = raw.read(self.CHUNK_SIZE)
+        while chunk is not None:
+            wire += len(chunk)
+            data = decoder.decode(chunk) if chunk else decoder.flush()
+            decoded += len(data)
+            if data:
+                if streams:
+                    sink.feed(data)
+                else:
+                    body.append(data)
+            if not chunk:
+                break
+            chunk = raw.read(self.CHUNK_SIZE)
+        return b''.join(body), wire, decoded
+
+    def _connect(self, scheme, host, port, timeout):
+        if scheme == 'https':
+            return HTTPSConnection(host, port, timeout=timeout)
+        return HTTPConnection(host, port, timeout=timeout)
+
+    def _headers(self, data, headers):
+        all_headers = {'User-Agent': 'Python-urllib', 'Connection': 'keep-alive'}
+        if data is not None:
+            all_headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        all_headers.update(self._encoding_headers(headers))
+        return all_headers
+
+    def evict_idle(self):
+        """ close connections idle for longer than idle_timeout """
+        with self._lock:
+            self._evict(time.monotonic())
+
+    def close(self):
+        with self._lock:
+            self._close_all()
+
+
+class AsyncConnectionPool(BasePool):
+    """
+        asyncio keep-alive pool
+        connections are (reader, writer) pairs
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._ssl_context = None
+
+    async def post(self, url, data, sink=None):
+        """
+            @url: page url
+            @data: url encoded POST body
+            @sink: optional object with feed(bytes),
+                gets the body chunk by chunk as it arrives
+            returns the raw body as bytes, b'' when it went to @sink
+            raises HTTPError or URLError,
+            the caller bounds the time with asyncio.wait_for
+        """
+        method = 'POST'
+        for _ in range(self.MAX_REDIRECTS + 1):
+            response = await self.request(method, url, data, sink=sink)
+            follow = self._redirect(url, method, data, response)
+            if follow is None:
+                return self._check(url, response)
+            url, method, data = follow
+        raise HTTPError(url, response.status, "too many redirects", response.headers, None)
+
+    async def request(self, method, url, data, headers=None, sink=None):
+        """
+            send one request on a pooled connection, returns a Response
+            a successful body is fed to @sink instead of the Response when given
+        """
+        scheme, host, port, path = split_url(url)
+        key = self._key(scheme, host, port)
+        stats = self.stats[self._host_name(key)]
+
+        conn = self._pop_idle(key)
+        reused = conn is not None
+        stats.in_use += 1
+        if sink is not None:
+            sink = FedSink(sink)
+        all_headers = {'Connection': 'keep-alive'}
+        all_headers.update(self._encoding_headers(headers))
+
+        try:
+            while True:
+                if conn is None:
+                    conn = await self._connect(scheme, host, port)
+                    stats.created += 1
+                else:
+                    stats.reused += 1
+                reader, writer = conn
+                try:
+                    writer.write(build_request(method, host, path, data, all_headers))
+                    await writer.drain()
+                    response = await self._read(reader, sink, stats)
+                except (OSError, asyncio.IncompleteReadError) as error:
+                    self._close(conn)
+                    conn = None
+                    if reused and not (sink is not None and sink.fed):
+                        # the server closed an idle keep-alive connection: retry once on a new one,
+                        # unless part of the body already went to the sink
+                        reused = False
+                        continue
+                    raise URLError(error) from error
+                break
+        except BaseException:
+            # includes cancellation by a timeout: the connection is mid response
+            if conn is not None:
+                self._close(conn)
+            stats.in_use -= 1
+            stats.discarded += 1
+            raise
+
+        stats.in_use -= 1
+        if response.headers.get('connection', '').lower() == 'close' or not self._push_idle(key, conn):
+            self._close(conn)
+            stats.discarded += 1
+        return response
+
+    async def _read(self, reader, sink, stats):
+        """
+            read a response, decoding its body as it arrives
+            a successful body goes to @sink when given
+        """
+        status, reason, headers = await read_head(reader)
+        body = []
+        if has_body(status):
+            decoder = Decoder(headers.get('content-encoding'))
+            streams = self._streams(sink, status)
+            async for chunk in iter_body(reader, headers, self.CHUNK_SIZE):
+                stats.wire_bytes += len(chunk)
+                self._emit(decoder.decode(chunk), streams, sink, body, stats)
+            self._emit(decoder.flush(), streams, sink, body, stats)
+        return Response(status, reason, headers, b''.join(body))
+
+    def _emit(self, data, streams, sink, body, stats):
+        if not data:
+            return
+        stats.decoded_bytes += len(data)
+        if streams:
+            sink.feed(data)
+        else:
+            body.append(data)
+
+    async def _connect(self, scheme, host, port):
+        try:
+            return await asyncio.open_connection(host, port, ssl=self._ssl() if scheme == 'https' else None)
+        except OSError as error:
+            raise URLError(error) from error
+
+    def _ssl(self):
+        if self._ssl_context is None:
+            self._ssl_context = ssl.create_default_context()
+        return self._ssl_context
+
+    def _close(self, conn):
+        conn[1].close()
+
+    def evict_idle(self):
+        """ close connections idle for longer than idle_timeout """
+        self._evict(time.monotonic())
+
+    def close(self):
+        self._close_all()
@@ -0,0 +1,224 @@
+import asyncio
+import threading
+import time
+from socket import timeout as sock_timeout
+from urllib.error import HTTPError, URLError
+from .http11 import split_url
+
+
+def is_overload(error):
+    """
+        True for failures that mean the host is struggling:
+        timeouts, 5xx and 429 responses, refused or reset connections
+    """
+    if isinstance(error, HTTPError):
+        return error.code >= 500 or error.code == 429
+    return isinstance(error, (sock_timeout, asyncio.TimeoutError, URLError))
+
+
+class TokenBucket:
+    """
+        @rate: tokens added per second
+        @burst: most tokens held at once
+    """
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self):
+        """
+            take one token, going into debt when none is left
+            returns the seconds to wait before using it
+        """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0
+        return -self.tokens / self.rate
+
+
+class AIMD:
+    """
+        additive increase, multiplicative decrease of a concurrency limit
+        @initial, @minimum, @maximum: requests in flight
+        @latency_target: seconds, slower responses stop the growth
+        @error_threshold: smoothed error rate above which growth stops
+        @backoff: factor applied to the limit on an overload failure,
+            at most once per latency_target so a burst of timeouts counts once
+    """
+    SMOOTHING = 0.1
+
+    def __init__(self, initial=4, minimum=1, maximum=64, latency_target=5.0, error_threshold=0.05, backoff=0.5):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_target = latency_target
+        self.error_threshold = error_threshold
+        self.backoff = backoff
+        self.error_rate = 0.0
+        self.backoffs = 0
+        self._last_backoff = None
+
+    def on_success(self, latency):
+        self.error_rate *= 1 - self.SMOOTHING
+        if latency is None:
+            return
+        if latency <= self.latency_target and self.error_rate <= self.error_threshold:
+            # grows by about one per limit's worth of responses
+            self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+
+    def on_failure(self):
+        self.error_rate = self.error_rate * (1 - self.SMOOTHING) + self.SMOOTHING
+        now = time.monotonic()
+        if self._last_backoff is None or now - self._last_backoff >= self.latency_target:
+            self.limit = max(self.minimum, self.limit * self.backoff)
+            self._last_backoff = now
+            self.backoffs += 1
+
+    @property
+    def slots(self):
+        return max(1, int(self.limit))
+
+
+class BaseHostLimiter:
+    """
+        token bucket for the request rate
+        and AIMD for the number of requests in flight
+        @rate, @burst: see TokenBucket
+        @aimd: keyword arguments of AIMD
+    """
+    def __init__(self, rate, burst, **aimd):
+        self.bucket = TokenBucket(rate, burst)
+        self.aimd = AIMD(**aimd)
+        self.in_flight = 0
+        self.requests = 0
+
+    def _record(self, latency, failed):
+        self.in_flight -= 1
+        self.requests += 1
+        if failed:
+            self.aimd.on_failure()
+        else:
+            self.aimd.on_success(latency)
+
+    def stats(self):
+        return {
+            'limit': round(self.aimd.limit, 2),
+            'in_flight': self.in_flight,
+            'requests': self.requests,
+            'error_rate': round(self.aimd.error_rate, 4),
+            'backoffs': self.aimd.backoffs
+        }
+
+
+class HostLimiter(BaseHostLimiter):
+    """ limiter for threads """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= self.aimd.slots:
+                self._cond.wait()
+            self.in_flight += 1
+            wait = self.bucket.take()
+        if wait:
+            try:
+                time.sleep(wait)
+            except BaseException:
+                # interrupted before the caller could release, give the slot back
+                with self._cond:
+                    self.in_flight -= 1
+                    self._cond.notify_all()
+                raise
+
+    def release(self, latency=None, failed=False):
+        """
+            @latency: seconds the request took, None if it gave no signal
+            @failed: the request hit an overload failure
+        """
+        with self._cond:
+            self._record(latency, failed)
+            self._cond.notify_all()
+
+
+class AsyncHostLimiter(BaseHostLimiter):
+    """ limiter for asyncio tasks """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cond = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight < self.aimd.slots)
+            self.in_flight += 1
+            wait = self.bucket.take()
+        if wait:
+            try:
+                await asyncio.sleep(wait)
+            except BaseException:
+                # cancelled before the caller could release, give the slot back
+                await asyncio.shield(self._cancel_slot())
+                raise
+
+    async def _cancel_slot(self):
+        async with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    async def release(self, latency=None, failed=False):
+        async with self._cond:
+            self._record(latency, failed)
+            self._cond.notify_all()
+
+
+class RateLimits:
+    """
+        one limiter per host, created on first use
+        @default: limiter settings for hosts not in @hosts
+        @hosts: {host name: limiter settings}
+        @limiter_class: HostLimiter or AsyncHostLimiter
+        settings are the keyword arguments of the limiter
+    """
+    DEFAULT = {'rate': 5.0, 'burst': 10, 'initial': 4, 'maximum': 32}
+    SAFER = {'rate': 10.0, 'burst': 20, 'initial': 8, 'maximum': 64}
+    LI = {'rate': 4.0, 'burst': 8, 'initial': 4, 'maximum': 24}
+
+    def __init__(self, default=None, hosts=None, limiter_class=HostLimiter):
+        self.default = default or self.DEFAULT
+        self.hosts = hosts or {}
+        self.limiter_class = limiter_class
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_fmcsa(cls, url_data, safer=None, li=None, limiter_class=HostLimiter):
+        """
+            @url_data: Settings().fmcsa_urls
+            separate limits for the SAFER host and the LI host
+        """
+        hosts = {
+            split_url(url_data['safer'])[1]: safer or cls.SAFER,
+            split_url(url_data['insurance_base'])[1]: li or cls.LI
+        }
+        return cls(hosts=hosts, limiter_class=limiter_class)
+
+    def for_host(self, host):
+        with self._lock:
+            try:
+                return self._limiters[host]
+            except KeyError:
+                settings = self.hosts.get(host, self.default)
+                limiter = self._limiters[host] = self.limiter_class(**settings)
+                return limiter
+
+    def for_url(self, url):
+        return self.for_host(split_url(url)[1])
+
+    def stats(self):
+        return {host: limiter.stats() for host, limiter in self._limiters.items()}
@@ -0,0 +1,216 @@
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+
+class Corpus:
+    """
+        recorded FMCSA responses on disk
+        a request is identified by its url path and its sorted POST params,
+        the host is left out so the corpus can be served from anywhere
+
+        <key>.json   url and params of the request
+        <key>.gz     gzip compressed body
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(url, params):
+        """
+            @url: request url
+            @params: dict or list of pairs or url encoded bytes
+        """
+        if isinstance(params, bytes):
+            params = parse_qsl(params.decode('utf-8'), keep_blank_values=True)
+        elif isinstance(params, dict):
+            params = params.items()
+        canonical = '{0}?{1}'.format(urlsplit(url).path, urlencode(sorted(params)))
+        return hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+
+    def _path(self, key, ext):
+        return os.path.join(self.directory, key + ext)
+
+    def save(self, url, params, body):
+        key = self.key(url, params)
+        if isinstance(params, bytes):
+            params = dict(parse_qsl(params.decode('utf-8'), keep_blank_values=True))
+        with open(self._path(key, '.gz'), 'wb') as f:
+            f.write(gzip.compress(body))
+        with open(self._path(key, '.json'), 'w') as f:
+            json.dump({'url': url, 'params': dict(params)}, f)
+        return key
+
+    def load(self, url, params):
+        """ recorded body as bytes, or None """
+        return self.load_key(self.key(url, params))
+
+    def load_key(self, key):
+        try:
+            with open(self._path(key, '.gz'), 'rb') as f:
+                return gzip.decompress(f.read())
+        except FileNotFoundError:
+            return None
+
+    def __iter__(self):
+        """ yields (url, params, body) for every recorded request """
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith('.json'):
+                continue
+            with open(os.path.join(self.directory, name)) as f:
+                meta = json.load(f)
+            yield meta['url'], meta['params'], self.load_key(name[:-5])
+
+
+class Recorder:
+    """
+        set as BasePage.recorder to save every successful fetch to @corpus
+    """
+    def __init__(self, corpus):
+        self.corpus = corpus if isinstance(corpus, Corpus) else Corpus(corpus)
+        self.recorded = 0
+        self._lock = threading.Lock()
+
+    def record(self, url, data, body):
+        self.corpus.save(url, data, body)
+        with self._lock:
+            self.recorded += 1
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        self._replay(self.rfile.read(length))
+
+    def do_GET(self):
+        self._replay(urlsplit(self.path).query.encode('utf-8'))
+
+    def _replay(self, data):
+        server = self.server
+        fault = server.pick_fault()
+        time.sleep(server.delay())
+
+        if fault == 'reset':
+            self.close_connection = True
+            return
+        if fault == 'stall':
+            time.sleep(server.stall)
+        if fault == 'error':
+            self._respond(503, b'injected error')
+            return
+
+        body = server.corpus.load(self.path, data)
+        with server.lock:
+            server.served += 1
+            if body is None:
+                server.missing += 1
+        if body is None:
+            self._respond(404, b'not recorded')
+        else:
+            self._respond(200, body)
+
+    def _respond(self, status, body):
+        # one write: headers and body in separate segments stall on delayed ACKs
+        head = 'HTTP/1.1 {0} {1}\r\nContent-Type: text/html\r\nContent-Length: {2}\r\n\r\n'.format(
+            status, self.responses.get(status, ('',))[0], len(body))
+        self.wfile.write(head.encode('ISO-8859-1') + body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ReplayServer(ThreadingHTTPServer):
+    """
+        serves a Corpus over local HTTP as a stand-in for the FMCSA sites
+        @corpus: Corpus or its directory
+        @latency: seconds added to every response
+        @jitter: up to this many more seconds, uniformly
+        @error_rate: share of requests answered with a 503
+        @stall_rate: share of requests held for @stall seconds first,
+            to provoke client timeouts
+        @reset_rate: share of connections closed without a response
+
+        point the crawl at it with Settings().fmcsa_urls = server.fmcsa_urls(original urls)
+    """
+    daemon_threads = True
+
+    def __init__(self, corpus, host='127.0.0.1', port=0, latency=0.0, jitter=0.0,
+                 error_rate=0.0, stall_rate=0.0, stall=180.0, reset_rate=0.0, seed=None):
+        super().__init__((host, port), ReplayHandler)
+        self.corpus = corpus if isinstance(corpus, Corpus) else Corpus(corpus)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.stall_rate = stall_rate
+        self.stall = stall
+        self.reset_rate = reset_rate
+        self.served = 0
+        self.missing = 0
+        self.lock = threading.Lock()
+        self._random = random.Random(seed)
+
+    def delay(self):
+        with self.lock:
+            return self.latency + self._random.uniform(0, self.jitter)
+
+    def pick_fault(self):
+        with self.lock:
+            roll = self._random.random()
+        for fault, rate in (('error', self.error_rate), ('stall', self.stall_rate), ('reset', self.reset_rate)):
+            if roll < rate:
+                return fault
+            roll -= rate
+        return None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return 'http://{0}:{1}'.format(host, port)
+
+    def fmcsa_urls(self, url_data):
+        """
+            @url_data: the real Settings().fmcsa_urls
+            returns the same urls pointing at this server
+        """
+        netloc = urlsplit(self.base_url).netloc
+        return {name: urlunsplit(urlsplit(url)._replace(scheme='http', netloc=netloc))
+                for name, url in url_data.items()}
+
+    def start(self):
+        """ serve from a background thread """
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a recorded FMCSA corpus')
+    parser.add_argument('corpus')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--stall-rate', type=float, default=0.0)
+    parser.add_argument('--stall', type=float, default=180.0)
+    parser.add_argument('--reset-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = ReplayServer(args.corpus, args.host, args.port, args.latency, args.jitter,
+                          args.error_rate, args.stall_rate, args.stall, args.reset_rate)
+    print("Replaying {0} on {1}".format(args.corpus, server.base_url))
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
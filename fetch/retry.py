@@ -0,0 +1,174 @@
+import asyncio
+import random
+import threading
+import time
+from scraper.models.fmcsa.exceptions import CircuitOpen
+from .http11 import split_url
+from .rate_limit import is_overload
+
+
+class CircuitBreaker:
+    """
+        state of one host
+        closed: requests go through
+        open: after @threshold overload failures in a row,
+            requests fail fast for @reset_timeout seconds
+        half_open: one trial request is let through,
+            success closes the circuit, failure opens it again,
+            a trial with no outcome after @reset_timeout is given up on
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, threshold, reset_timeout):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.trips = 0
+        self.opened_at = None
+        self._trial_at = None
+
+    def allow(self):
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = self.HALF_OPEN
+            self._trial_at = None
+        if self.state == self.HALF_OPEN:
+            now = time.monotonic()
+            if self._trial_at is not None and now - self._trial_at < self.reset_timeout:
+                return False
+            self._trial_at = now
+        return True
+
+    def record(self, failed):
+        if not failed:
+            self.state = self.CLOSED
+            self.failures = 0
+            return
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+            if self.state != self.OPEN:
+                self.trips += 1
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+
+class RetryPolicy:
+    """
+        retries with exponential backoff and full jitter
+        behind a circuit breaker per host
+        @retries: attempts after the first one
+        @base_delay, @max_delay: seconds, the nth retry waits
+            a random time up to min(max_delay, base_delay * 2 ** n)
+        @breaker_threshold: overload failures in a row that open a host's circuit
+        @breaker_reset: seconds a circuit stays open
+
+        only overload failures (timeouts, 5xx, 429, connection errors)
+        are retried and counted by the breakers, see is_overload
+    """
+    DEFAULT_RETRIES = 3
+    DEFAULT_BASE_DELAY = 0.5
+    DEFAULT_MAX_DELAY = 30
+    DEFAULT_BREAKER_THRESHOLD = 5
+    DEFAULT_BREAKER_RESET = 60
+
+    def __init__(self, retries=DEFAULT_RETRIES, base_delay=DEFAULT_BASE_DELAY, max_delay=DEFAULT_MAX_DELAY,
+                 breaker_threshold=DEFAULT_BREAKER_THRESHOLD, breaker_reset=DEFAULT_BREAKER_RESET):
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset = breaker_reset
+        self.breakers = {}
+        self.retried = 0
+        self.exhausted = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def breaker(self, url):
+        host = split_url(url)[1]
+        with self._lock:
+            try:
+                return self.breakers[host]
+            except KeyError:
+                breaker = self.breakers[host] = CircuitBreaker(self.breaker_threshold, self.breaker_reset)
+                return breaker
+
+    def delay(self, attempt):
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _before(self, url, breaker):
+        with self._lock:
+            if breaker.allow():
+                return
+            self.rejected += 1
+        raise CircuitOpen("circuit open for {0}".format(split_url(url)[1]))
+
+    def _after(self, breaker, error, attempt):
+        """
+            record the outcome, returns True when @error should be retried
+        """
+        failed = error is not None and is_overload(error)
+        with self._lock:
+            breaker.record(failed)
+            if not failed:
+                return False
+            if attempt < self.retries and breaker.state == breaker.CLOSED:
+                self.retried += 1
+                return True
+            self.exhausted += 1
+            return False
+
+    def call(self, request, url):
+        """
+            @request: callable doing one attempt
+            @url: used to pick the host's breaker
+            raises CircuitOpen while the host's circuit is open
+        """
+        breaker = self.breaker(url)
+        attempt = 0
+        while True:
+            self._before(url, breaker)
+            try:
+                result = request()
+            except Exception as error:
+                if not self._after(breaker, error, attempt):
+                    raise
+            else:
+                self._after(breaker, None, attempt)
+                return result
+            time.sleep(self.delay(attempt))
+            attempt += 1
+
+    async def call_async(self, request, url):
+        """
+            same as call, @request returns an awaitable
+        """
+        breaker = self.breaker(url)
+        attempt = 0
+        while True:
+            self._before(url, breaker)
+            try:
+                result = await request()
+            except Exception as error:
+                if not self._after(breaker, error, attempt):
+                    raise
+            else:
+                self._after(breaker, None, attempt)
+                return result
+            await asyncio.sleep(self.delay(attempt))
+            attempt += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'retries': self.retried,
+                'exhausted': self.exhausted,
+                'rejected': self.rejected,
+                'trips': sum(breaker.trips for breaker in self.breakers.values()),
+                'open': sorted(host for host, breaker in self.breakers.items()
+                               if breaker.state != breaker.CLOSED)
+            }
@@ -2,7 +2,10 @@ from sqlalchemy import and_
 from sqlalchemy.sql import func
 from sqlalchemy.orm.exc import NoResultFound
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.schema import UniqueConstraint
 from scraper.db import Shard
+from .cache import CarrierIdEntry, NegativeEntry
+from .crawl import CrawlSchedule, FrontierItem
 from .census import CensusReport
 from .sms import SMSReport
 from .report import (
@@ -19,6 +22,8 @@ from .report import (
 
 class FMCSAManager:
     __shardname__ = 'fmcsa'
+    # set to a RecrawlScheduler to record whether each scraped report changed
+    scheduler = None
 
     @classmethod
     def __setup__(cls):
@@ -33,6 +38,10 @@ class FMCSAManager:
         AuthorityHistoryReport._create_table(shard)
         PendingApplicationReport._create_table(shard)
         RevocationReport._create_table(shard)
+        CarrierIdEntry._create_table(shard)
+        NegativeEntry._create_table(shard)
+        CrawlSchedule._create_table(shard)
+        FrontierItem._create_table(shard)
 
     def __init__(self):
         self.shard = Shard(self.__shardname__)
@@ -59,6 +68,10 @@ class FMCSAManager:
         return self.shard.query(report_type).filter(where).one()
 
     def add_scraped_report(self, dot_number, report, cls=SaferReport):
+        """
+            returns True when a new version was written
+        """
+        changed = True
         try:
             latest_report = self.get_latest_report(cls, dot_number)
         except NoResultFound:
@@ -71,10 +84,59 @@ class FMCSAManager:
                 #  But it is different than this new one
                 #  save a new version
                 self.add_versioned_report(cls, report)
+            else:
+                changed = False
+        self.observe(dot_number, cls, changed)
+        return changed
 
-    def add_insurance_report(self, dot_number, report, cls=InsuranceHistoryReport):
+    def observe(self, dot_number, cls, changed):
+        """
+            tell the scheduler a crawl of @cls for @dot_number
+            did or did not find a change
+        """
+        if self.scheduler is not None:
+            self.scheduler.observe(dot_number, cls.__tablename__, changed, shard=self.shard)
+
+    def insurance_key_columns(self, cls=InsuranceHistoryReport):
+        """
+            the columns of @cls's unique key but dot_number,
+            None when @cls has no unique key
+        """
+        for constraint in cls.__table__.constraints:
+            if isinstance(constraint, UniqueConstraint):
+                return [column for column in constraint.columns if column.key != 'dot_number']
+        return None
+
+    def insurance_keys(self, dot_number, cls=InsuranceHistoryReport):
+        """
+            the unique keys of the @cls rows stored for @dot_number,
+            read in one query so a page's rows are checked against them
+            rather than with a query each, see add_insurance_report
+        """
+        columns = self.insurance_key_columns(cls)
+        if columns is None:
+            return set()
+        rows = self.shard.query(*columns).filter(cls.dot_number == dot_number).all()
+        return set(tuple(row) for row in rows)
+
+    def add_insurance_report(self, dot_number, report, cls=InsuranceHistoryReport, stored=None):
+        """
+            @stored: insurance_keys(dot_number, cls), loaded once per page,
+                keys added here are put in it, read here when not given
+            returns True when the row was not stored before,
+            the page observes once for all its rows, see InsuranceBasePage._observe
+        """
+        columns = self.insurance_key_columns(cls)
+        if columns is not None:
+            if stored is None:
+                stored = self.insurance_keys(dot_number, cls)
+            key = tuple(getattr(report, column.key) for column in columns)
+            if key in stored:
+                return False
+            stored.add(key)
         try:
             self.shard.add(report)
         except IntegrityError as e:
-            # log this
-            pass
+            # stored meanwhile by another crawler
+            return False
+        return True
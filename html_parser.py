@@ -0,0 +1,44 @@
+import threading
+from io import BytesIO
+from lxml import etree
+
+
+ENCODING = 'ISO-8859-1'
+
+# nothing looks elements up by id, and the blank text between
+# table tags is never extracted, so neither is kept
+OPTIONS = {
+    'encoding': ENCODING,
+    'collect_ids': False,
+    'remove_blank_text': True
+}
+
+_local = threading.local()
+
+
+def new_parser():
+    """ an HTMLParser with OPTIONS, for feed parsing """
+    return etree.HTMLParser(**OPTIONS)
+
+
+def thread_parser():
+    """
+        the HTMLParser of this thread
+        a parser is not thread safe, but parse() can reuse one
+        for every page a thread parses
+    """
+    parser = getattr(_local, 'parser', None)
+    if parser is None:
+        parser = _local.parser = new_parser()
+    return parser
+
+
+def parse_html(body):
+    """
+        @body: the page as fetched, bytes in ENCODING,
+            str is encoded back first
+        returns the document as an ElementTree
+    """
+    if isinstance(body, str):
+        body = body.encode(ENCODING, 'xmlcharrefreplace')
+    return etree.parse(BytesIO(body), thread_parser())
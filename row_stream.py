@@ -0,0 +1,86 @@
+import re
+from io import BytesIO
+from lxml import etree
+from .html_parser import ENCODING, OPTIONS
+
+
+# the table expressions a stream can follow, e.g. //font/table[4]
+TABLE = re.compile(r'^//(\w+)/table\[(\d+)\]$')
+
+
+def streamable(expr):
+    return TABLE.match(expr) is not None
+
+
+def _events(html, events):
+    if isinstance(html, str):
+        html = html.encode(ENCODING, 'xmlcharrefreplace')
+    # parsed like the pages are, so rows come out the same
+    return etree.iterparse(BytesIO(html), events=events, html=True, **OPTIONS)
+
+
+def _drop_done(element):
+    """
+        remove the siblings before @element, already parsed and used,
+        so the ancestors of a cleared element do not keep it
+    """
+    parent = element.getparent()
+    if parent is not None:
+        while element.getprevious() is not None:
+            del parent[0]
+
+
+def iter_rows(prop, html, watch=None):
+    """
+        @prop: a TableRowsProperty whose expr is streamable
+        @html: the page
+        @watch: optional, called with every element that completes
+            before the table starts, e.g. to raise on a marker, so no row
+            is yielded before it has seen them all; without the table it
+            sees the whole page
+        yields the dicts prop.from_nodes would return, in order,
+        each as soon as the rows it needs are parsed,
+        elements before the table and rows already used are removed,
+        parsing stops at the end of the table
+    """
+    parent_tag, position = TABLE.match(prop.expr).groups()
+    position = int(position)
+    table = None
+    # parent_tag/table elements seen, per parent
+    tables = {}
+    pending = []
+    for event, element in _events(html, ('start', 'end')):
+        if table is None:
+            if event == 'start':
+                parent = element.getparent()
+                if element.tag == 'table' and parent is not None and parent.tag == parent_tag:
+                    tables[parent] = tables.get(parent, 0) + 1
+                    if tables[parent] == position:
+                        table = element
+                continue
+            if watch is not None:
+                watch(element)
+            # parsed and not needed
+            element.clear(keep_tail=True)
+            _drop_done(element)
+            continue
+        if event != 'end':
+            continue
+        if element is table:
+            break
+        if element.getparent() is not table:
+            continue
+        if prop.is_row(element):
+            pending.append(element)
+        while pending and prop.row_complete(pending[0]):
+            data = prop.row(pending.pop(0))
+            if data is not None:
+                yield data
+        # rows before the oldest pending one are no longer read
+        keep = pending[0] if pending else element
+        while keep.getprevious() is not None:
+            del table[0]
+    for tr in pending:
+        data = prop.row(tr)
+        if data is not None:
+            yield data
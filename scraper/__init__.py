@@ -1,5 +1,7 @@
 # package
 from .base_page import BasePage
+from .bundle import CarrierBundle
+from .discovery import Discovery, DotIndex
 from .insurance_page import (
     ActiveInsurancePage,
     AuthorityHistoryPage,
@@ -10,16 +12,23 @@ from .insurance_page import (
     RevocationPage
 )
 from .license_page import LicensePage
+from .parse_pool import ParsePool
+from .pipeline import Pipeline
 from .safer_page import SaferPage
 
 __all__ = [
     ActiveInsurancePage,
     AuthorityHistoryPage,
     BasePage,
+    CarrierBundle,
+    Discovery,
+    DotIndex,
     InsuranceBasePage,
     InsuranceHistoryPage,
     LicensePage,
+    ParsePool,
     PendingApplicationPage,
+    Pipeline,
     RejectedInsurancePage,
     RevocationPage,
     SaferPage
@@ -1,27 +1,96 @@
-from io import StringIO
-from lxml import etree
-from urllib import parse, request
+import asyncio
+import functools
+from urllib import parse
 from scraper.models.fmcsa.exceptions import TimeoutError
 from urllib.error import HTTPError, URLError
 from socket import timeout as sock_timeout
 from scraper.models.fmcsa.report import SaferReport
+from scraper.models.fmcsa import FMCSAManager
 from scraper.config import Settings
+from scraper.db import Shard
+from scraper.models.fmcsa.cache import CarrierIdCache
+from scraper.models.fmcsa.fetch import ConnectionPool
+from scraper.models.fmcsa.html_parser import ENCODING, parse_html
+from .stream_parser import StreamingParse
+import transaction
 #from random import choice
 
 
+def skip_unchanged(create_report):
+    """
+        decorator for the create_report methods of pages
+        a page marked unchanged by the html cache is not reported again,
+        only counted as unchanged by the manager's scheduler,
+        otherwise its html digest is recorded once the report is committed,
+        create_report sets commit_failed when it catches a failed commit
+    """
+    @functools.wraps(create_report)
+    def wrapper(self, *args, **kwargs):
+        if self.unchanged:
+            if self.report_type is not None and self.manager.scheduler is not None:
+                try:
+                    self.manager.observe(self.dot_number, self.report_type, False)
+                    transaction.commit()
+                except Exception as e:
+                    print("Caught Exception on transaction commit: {0}".format(str(e)))
+            return None
+        self.commit_failed = False
+        result = create_report(self, *args, **kwargs)
+        # a rolled back page is reported again on the next crawl
+        if self.html_digest is not None and not self.commit_failed:
+            self.html_cache.mark(self._page_type(), self.dot_number, self.html_digest)
+        return result
+    return wrapper
+
+
 class BasePage:
     """
         Base Page for Safer and Insurance/License Pages
         define timeout
-        set html parser
+        http_pool: keep-alive ConnectionPool shared by every page,
+            created on first fetch, assign one to size it differently
+        carrier_ids: CarrierIdCache shared by every page,
+            saves the insurance_base lookup for known DOT numbers
+        html_cache: optional HTMLCache, when set a page whose html
+            is the same as the last persisted one is marked unchanged
+            and is neither parsed nor reported
+        retry_policy: optional RetryPolicy, retries transient fetch
+            failures and fails fast with CircuitOpen while a host is down
+        negative_cache: optional NegativeCache, DOT numbers SAFER
+            reported missing or inactive raise again before any fetch
+        streaming: parse pages as their bytes arrive instead of
+            reading and decoding the whole body first
+        recorder: optional fetch.replay.Recorder, saves every fetched
+            body with its url and params for the replay server
+        report_type: report model the page is saved as,
+            keys the page's change history in the recrawl scheduler
+        extraction_plan: optional ExtractionPlan of the page class,
+            extracts every descriptor in one pass on the first read
+        extraction_backend: optional ExtractionBackend, used instead
+            of the extraction_plan, e.g. a TokenBackend that needs no tree
+            or a ShadowBackend comparing two backends
     """
     DEFAULT_TIMEOUT = 120
+    http_pool = None
+    carrier_ids = None
+    html_cache = None
+    retry_policy = None
+    negative_cache = None
+    streaming = False
+    recorder = None
+    report_type = None
+    extraction_plan = None
+    extraction_backend = None
+    unchanged = False
+    commit_failed = False
+    html_digest = None
+    html_body = None
+    _root = None
 
     def __init__(self, *args, **kwargs):
         for name, value in kwargs.items():
             setattr(self, name, value)
 
-        self.parser = etree.HTMLParser()
         settings = Settings()
         self.url_data = settings.fmcsa_urls
 
@@ -32,7 +101,8 @@ class BasePage:
                 OR
             return the params for an insurance url
             insurance url's use their internal key, not dot_number
-            if @url is an insurance url, calls self._get_html to get internal id
+            if @url is an insurance url, the internal id comes from
+            the carrier id cache or from self._get_html
         """
         if url == self.url_data['safer']:
             params = {
@@ -47,31 +117,67 @@ class BasePage:
                 'n_dotno': self.dot_number
             }
             return params
-        elif url in (self.url_data['insurance_detail'],
-                     self.url_data['insurance_active'],
-                     self.url_data['insurance_rejected'],
-                     self.url_data['insurance_history'],
-                     self.url_data['authority_history'],
-                     self.url_data['insurance_pending'],
-                     self.url_data['insurance_revocation']):
-            params = {}
-            html = self._get_html(self.url_data['insurance_base'])
-            root = etree.parse(StringIO(html), self.parser)
-            # Find the HTML Button (form)
-            # get the internal id (pv_apcant_id) of
-            # the insurance record for this dot_number
-            for form in root.xpath('//form[@action="pkg_carrquery.prc_getdetail"]'):
-                for input_type in form.getchildren():
-                    name = input_type.attrib.get('name')
-                    value = input_type.attrib.get('value')
-                    if name in ('pv_apcant_id', 'pv_vpath'):
-                        params[name] = value
+        elif self._is_detail_url(url):
+            params = self._known_internal_id()
+            if params is None:
+                html = self._get_html(self.url_data['insurance_base'])
+                params = self._internal_id_params(html)
+                self._remember_internal_id(params)
             return params
 
-    def _get_html(self, url, timeout=DEFAULT_TIMEOUT):
+    def _is_detail_url(self, url):
+        """
+            insurance detail urls are keyed by the LI internal id
+        """
+        return url in (self.url_data['insurance_detail'],
+                       self.url_data['insurance_active'],
+                       self.url_data['insurance_rejected'],
+                       self.url_data['insurance_history'],
+                       self.url_data['authority_history'],
+                       self.url_data['insurance_pending'],
+                       self.url_data['insurance_revocation'])
+
+    def _internal_id_params(self, html):
+        """
+            @html: the insurance_base page for this dot_number
+            returns the params for an insurance detail url
+        """
+        params = {}
+        root = parse_html(html)
+        # Find the HTML Button (form)
+        # get the internal id (pv_apcant_id) of
+        # the insurance record for this dot_number
+        for form in root.xpath('//form[@action="pkg_carrquery.prc_getdetail"]'):
+            for input_type in form.getchildren():
+                name = input_type.attrib.get('name')
+                value = input_type.attrib.get('value')
+                if name in ('pv_apcant_id', 'pv_vpath'):
+                    params[name] = value
+        return params
+
+    def _known_internal_id(self):
+        """
+            params resolved by the caller (internal_id attribute)
+            or by the carrier id cache, None when unknown
+        """
+        params = getattr(self, 'internal_id', None)
+        if params is not None:
+            return dict(params)
+        return self._get_carrier_ids().get(self.dot_number)
+
+    def _remember_internal_id(self, params):
+        """
+            cache params only when the insurance_base page had the form
+        """
+        if params.get('pv_apcant_id'):
+            self._get_carrier_ids().put(self.dot_number, params)
+
+    def _get_html(self, url, timeout=DEFAULT_TIMEOUT, stream=False):
         """
             @url
             @timeout
+            @stream: return a StreamingParse fed as the body arrived
+                instead of the HTML
             create a request object based on @url
             fetch and return HTML based on that request object
             calls self._query_params to create request
@@ -80,22 +186,299 @@ class BasePage:
         """
         data = parse.urlencode(self._query_params(url)).encode('utf-8')
         try:
-            req = request.Request(url, data)
-            response = request.urlopen(req, timeout=timeout)
-            html = response.read().decode('ISO-8859-1')
+            body = self._post(url, data, timeout, stream)
         except (HTTPError, URLError) as error:
             print("Caught Error fetching from {0} {1}: {2}".format(url, str(data), str(error)))
+            if self._is_detail_url(url):
+                self._get_carrier_ids().invalidate(self.dot_number)
             raise(error)
         except sock_timeout:
             raise(TimeoutError("TimeoutError: {0}, {1}".format(url, str(data))))
         else:
-            return html
+            return self._received(url, data, body)
+
+    def _post(self, url, data, timeout, stream=False):
+        """
+            one fetch through the pool, retried by the retry policy
+            returns bytes, or a StreamingParse when @stream
+        """
+        def attempt():
+            if not stream:
+                return self._get_pool().post(url, data, timeout)
+            # a new sink per attempt, a failed attempt may have fed part of a page
+            sink = self._sink()
+            self._get_pool().post(url, data, timeout, sink=sink)
+            return sink
+
+        if self.retry_policy is None:
+            return attempt()
+        return self.retry_policy.call(attempt, url)
+
+    async def _post_async(self, url, data, fetcher, timeout, stream=False):
+        async def attempt():
+            if not stream:
+                return await fetcher.post(url, data, timeout)
+            sink = self._sink()
+            await fetcher.post(url, data, timeout, sink=sink)
+            return sink
+
+        if self.retry_policy is None:
+            return await attempt()
+        return await self.retry_policy.call_async(attempt, url)
+
+    def _sink(self):
+        # the html cache and the recorder store whole bodies, so they have to be kept
+        return StreamingParse(keep=self.html_cache is not None or self.recorder is not None)
+
+    def _received(self, url, data, body):
+        """
+            @data: the url encoded params sent
+            @body: bytes or a StreamingParse
+            returns the body, parsed from bytes when needed
+        """
+        raw = body.body() if isinstance(body, StreamingParse) else body
+        if self.recorder is not None:
+            self.recorder.record(url, data, raw)
+        if raw is not None:
+            self._check_unchanged(url, raw)
+        return body
+
+    def _check_unchanged(self, url, body):
+        """
+            with an html_cache, store the body of this page's own url
+            and note whether it is the same as the last one persisted
+        """
+        if self.html_cache is None or url != getattr(self, 'url', None):
+            return
+        self.html_digest = self.html_cache.put(body)
+        self.unchanged = self.html_cache.is_unchanged(self._page_type(), self.dot_number, self.html_digest)
+
+    def _page_type(self):
+        return type(self).__name__
+
+    @classmethod
+    def _get_pool(cls):
+        if BasePage.http_pool is None:
+            BasePage.http_pool = ConnectionPool()
+        return BasePage.http_pool
+
+    @classmethod
+    def _get_carrier_ids(cls):
+        if BasePage.carrier_ids is None:
+            shard = Shard(FMCSAManager.__shardname__, join_transaction=False)
+            BasePage.carrier_ids = CarrierIdCache(shard)
+        return BasePage.carrier_ids
+
+    async def _query_params_async(self, url, fetcher, timeout=DEFAULT_TIMEOUT):
+        """
+            same as self._query_params
+            but the insurance_base lookup goes through @fetcher
+        """
+        if self._is_detail_url(url):
+            params = self._known_internal_id()
+            if params is None:
+                html = await self._get_html_async(self.url_data['insurance_base'], fetcher, timeout)
+                params = self._internal_id_params(html)
+                self._remember_internal_id(params)
+            return params
+        return self._query_params(url)
+
+    async def _get_html_async(self, url, fetcher, timeout=DEFAULT_TIMEOUT, stream=False):
+        """
+            @url
+            @fetcher: AsyncFetcher shared by the crawl
+            @timeout
+            @stream: as for self._get_html
+            same contract as self._get_html:
+            HTTPError/URLError are reraised, socket timeouts become TimeoutError
+        """
+        data = parse.urlencode(await self._query_params_async(url, fetcher, timeout)).encode('utf-8')
+        try:
+            body = await self._post_async(url, data, fetcher, timeout, stream)
+        except (HTTPError, URLError) as error:
+            print("Caught Error fetching from {0} {1}: {2}".format(url, str(data), str(error)))
+            if self._is_detail_url(url):
+                self._get_carrier_ids().invalidate(self.dot_number)
+            raise(error)
+        except (sock_timeout, asyncio.TimeoutError):
+            raise(TimeoutError("TimeoutError: {0}, {1}".format(url, str(data))))
+        else:
+            return self._received(url, data, body)
+
+    def _set_url(self):
+        """
+            subclasses set self.url to the page they scrape
+        """
+        raise NotImplementedError
+
+    def _fetch(self, timeout=DEFAULT_TIMEOUT):
+        """
+            fetch self.url and load it, streaming when self.streaming
+        """
+        self._check_negative()
+        if self.streaming:
+            self._load_stream(self._get_html(self.url, timeout, stream=True))
+        else:
+            self._load(self._get_html(self.url, timeout))
+
+    async def _fetch_async(self, fetcher, timeout=DEFAULT_TIMEOUT):
+        self._check_negative()
+        if self.streaming:
+            self._load_stream(await self._get_html_async(self.url, fetcher, timeout, stream=True))
+        else:
+            self._load(await self._get_html_async(self.url, fetcher, timeout))
+
+    def _check_negative(self):
+        """
+            raises RecordNotFound or BadDOTNumber for a number
+            the negative cache knows is dead
+        """
+        if self.negative_cache is not None:
+            self.negative_cache.check(self.dot_number)
+
+    def _remember_negative(self, outcome):
+        """
+            @outcome: NegativeCache.NOT_FOUND or NegativeCache.INACTIVE,
+                only as read off the SAFER page by SaferPage._is_valid
+        """
+        if self.negative_cache is not None:
+            self.negative_cache.put(self.dot_number, outcome)
+
+    def _load(self, html_body):
+        """
+            @html_body: this page as fetched, bytes
+            keep it to parse on first use and attach a data manager
+        """
+        if isinstance(html_body, str):
+            html_body = html_body.encode(ENCODING, 'xmlcharrefreplace')
+        self.html_body = html_body
+        self.body_size = len(html_body)
+        self._root = None
+        self.invalidate()
+        if getattr(self, 'manager', None) is None:
+            self.manager = FMCSAManager()
+
+    def _load_stream(self, sink):
+        """
+            @sink: StreamingParse fed with the whole body
+            the page keeps only the tree, never the HTML
+        """
+        self.body_size = sink.size
+        self.invalidate()
+        if sink.size:
+            self.html_body = None
+            self._root = sink.close()
+        else:
+            # nothing was fed, behave like an empty page
+            self.html_body = b''
+            self._root = None
+        if getattr(self, 'manager', None) is None:
+            self.manager = FMCSAManager()
+
+    @property
+    def html_doc(self):
+        """
+            the decoded HTML, None for a streamed page
+        """
+        if self.html_body is None:
+            return None
+        return self.html_body.decode(ENCODING)
+
+    def invalidate(self, *names):
+        """
+            forget extracted descriptor values, all of them or @names,
+            so the next read extracts them again from the tree
+        """
+        extracted = self.__dict__.get('_extracted')
+        if not extracted:
+            return
+        if not names:
+            extracted.clear()
+        for name in names:
+            extracted.pop(name, None)
+
+    def iter_rows(self, name, watch=None):
+        """
+            @name: a table descriptor of this page
+            its rows one at a time, see TableRowsProperty.iter_rows
+        """
+        return getattr(type(self), name).iter_rows(self, watch)
+
+    @property
+    def root(self):
+        """
+            parsed on first use, so unchanged pages are never parsed
+        """
+        if self._root is None:
+            self._root = parse_html(self.html_body)
+        return self._root
+
+    @classmethod
+    async def fetch(cls, dot_number, fetcher, timeout=DEFAULT_TIMEOUT, **attributes):
+        """
+            async constructor
+            @dot_number
+            @fetcher: AsyncFetcher shared by the crawl
+            @timeout
+            @attributes: set on the page before fetching,
+                e.g. manager, internal_id or have_safer_record
+            returns a page like cls(dot_number, timeout) would
+        """
+        page = cls._new(dot_number, **attributes)
+        await page._fetch_async(fetcher, timeout)
+        return page
+
+    @classmethod
+    def from_html(cls, dot_number, html, manager=None, **attributes):
+        """
+            constructor for html already at hand:
+            cached, replayed or fetched by someone else
+            @dot_number
+            @html: the body as bytes, or already decoded
+            @manager: FMCSAManager reports are added with,
+                one is created if not given
+            @attributes: as for fetch
+            nothing is fetched
+        """
+        if manager is not None:
+            attributes['manager'] = manager
+        page = cls._new(dot_number, **attributes)
+        page._load(html)
+        return page
+
+    @classmethod
+    def _new(cls, dot_number, **attributes):
+        """
+            a page with its url set, bypassing the fetching constructors
+        """
+        page = cls.__new__(cls)
+        BasePage.__init__(page, dot_number=dot_number, **attributes)
+        page._set_url()
+        return page
+
+    @classmethod
+    async def fetch_many(cls, dot_numbers, fetcher, timeout=DEFAULT_TIMEOUT, **attributes):
+        """
+            fetch a page for every dot number concurrently
+            the fetcher's caps bound how many are in flight
+            @attributes: set on every page, as for fetch
+            returns a list in the order of @dot_numbers,
+            failed fetches are returned as their exception
+        """
+        return await asyncio.gather(
+            *(cls.fetch(dot_number, fetcher, timeout, **attributes) for dot_number in dot_numbers),
+            return_exceptions=True
+        )
 
     def _have_dot_number(self, dot_number):
         """
             when safer page is not _is_valid
             no reason to get insurance/license data
+            a CarrierBundle sets have_safer_record so this is queried once
         """
+        known = getattr(self, 'have_safer_record', None)
+        if known is not None:
+            return known
         entry = self.manager.shard.query(SaferReport).filter(SaferReport.dot_number == self.dot_number).scalar()
         if entry is not None:
             return True
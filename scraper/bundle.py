@@ -0,0 +1,99 @@
+import asyncio
+from scraper.models.fmcsa.exceptions import NoScrapedRows, RecordNotFound
+from scraper.models.fmcsa import FMCSAManager
+from .base_page import BasePage
+from .insurance_page import (
+    ActiveInsurancePage,
+    AuthorityHistoryPage,
+    InsuranceHistoryPage,
+    PendingApplicationPage,
+    RejectedInsurancePage,
+    RevocationPage
+)
+from .license_page import LicensePage
+
+
+class CarrierBundle:
+    """
+        every LI page for one DOT number
+        the insurance_base lookup, the safer record check
+        and the FMCSAManager are shared by all pages,
+        the pages themselves are fetched concurrently
+
+        pages: {page class name: page}
+        errors: {page class name: exception raised fetching it}
+    """
+    PAGE_CLASSES = (
+        LicensePage,
+        InsuranceHistoryPage,
+        ActiveInsurancePage,
+        RejectedInsurancePage,
+        AuthorityHistoryPage,
+        PendingApplicationPage,
+        RevocationPage
+    )
+
+    def __init__(self, dot_number, pages, errors, manager):
+        self.dot_number = dot_number
+        self.pages = pages
+        self.errors = errors
+        self.manager = manager
+
+    @classmethod
+    async def fetch(cls, dot_number, fetcher, timeout=BasePage.DEFAULT_TIMEOUT, manager=None):
+        """
+            @dot_number
+            @fetcher: AsyncFetcher shared by the crawl
+            @timeout: per request
+            @manager: FMCSAManager to share, one is created if not given
+            raises RecordNotFound if there is no stored safer record
+            raises NoScrapedRows if LI has no record for @dot_number
+        """
+        if manager is None:
+            manager = FMCSAManager()
+        base = BasePage(dot_number=dot_number, manager=manager)
+
+        if not base._have_dot_number(dot_number):
+            raise RecordNotFound('no safer record stored for {0}'.format(dot_number))
+
+        internal_id = await base._query_params_async(base.url_data['insurance_detail'], fetcher, timeout)
+        if not internal_id.get('pv_apcant_id'):
+            raise NoScrapedRows('{0} has no LI record'.format(dot_number))
+
+        results = await asyncio.gather(
+            *(page_cls.fetch(dot_number, fetcher, timeout,
+                             manager=manager, internal_id=internal_id, have_safer_record=True)
+              for page_cls in cls.PAGE_CLASSES),
+            return_exceptions=True
+        )
+
+        pages = {}
+        errors = {}
+        for page_cls, result in zip(cls.PAGE_CLASSES, results):
+            if isinstance(result, Exception):
+                errors[page_cls.__name__] = result
+            else:
+                pages[page_cls.__name__] = result
+        return cls(dot_number, pages, errors, manager)
+
+    def create_reports(self, parse_pool=None):
+        """
+            run create_report on every fetched page
+            @parse_pool: ParsePool to parse the pages in worker processes
+            returns {page class name: NoScrapedRows raised or None}
+        """
+        if parse_pool is not None:
+            outcome = dict(zip(self.pages, parse_pool.create_reports(list(self.pages.values()))))
+            for name, error in outcome.items():
+                if error is not None and not isinstance(error, NoScrapedRows):
+                    raise error
+            return outcome
+        outcome = {}
+        for name, page in self.pages.items():
+            try:
+                page.create_report()
+            except NoScrapedRows as e:
+                outcome[name] = e
+            else:
+                outcome[name] = None
+        return outcome
@@ -0,0 +1,206 @@
+import os
+import threading
+import zlib
+from scraper.models.fmcsa.cache import NegativeCache, NegativeEntry
+from scraper.models.fmcsa.exceptions import BadDOTNumber, RecordNotFound
+from scraper.models.fmcsa.report import SaferReport
+from .base_page import BasePage
+from .safer_page import SaferPage
+
+
+class DotIndex:
+    """
+        state of every DOT number in 2 bits, about 1.2MB for 5 million numbers
+        UNKNOWN: never probed
+        VALID: SAFER has an active record
+        NOT_FOUND: "No records matching"
+        INACTIVE: SAFER has a record that is not active
+        @path: file the index is saved to and loaded from, zlib compressed
+    """
+    UNKNOWN = 0
+    VALID = 1
+    NOT_FOUND = 2
+    INACTIVE = 3
+    STATES = ('unknown', 'valid', 'not_found', 'inactive')
+
+    def __init__(self, path=None):
+        self.path = path
+        self._bits = bytearray()
+        self.highest = None
+        self._lock = threading.Lock()
+        if path is not None and os.path.exists(path):
+            self.load()
+
+    def __len__(self):
+        """ numbers the index has room for """
+        return len(self._bits) * 4
+
+    def get(self, dot_number):
+        dot_number = int(dot_number)
+        byte = dot_number >> 2
+        if byte >= len(self._bits):
+            return self.UNKNOWN
+        return (self._bits[byte] >> ((dot_number & 3) * 2)) & 3
+
+    def set(self, dot_number, state):
+        dot_number = int(dot_number)
+        byte = dot_number >> 2
+        shift = (dot_number & 3) * 2
+        with self._lock:
+            if byte >= len(self._bits):
+                # grow past the request so probing upwards does not resize every time
+                self._bits.extend(bytes(byte + 1 - len(self._bits) + 4096))
+            self._bits[byte] = (self._bits[byte] & ~(3 << shift)) | (state << shift)
+            if state == self.VALID and (self.highest is None or dot_number > self.highest):
+                self.highest = dot_number
+            elif state != self.VALID and dot_number == self.highest:
+                self.highest = self._find_highest()
+
+    def _find_highest(self):
+        for byte in range(len(self._bits) - 1, -1, -1):
+            value = self._bits[byte]
+            for slot in (3, 2, 1, 0):
+                if (value >> (slot * 2)) & 3 == self.VALID:
+                    return byte * 4 + slot
+        return None
+
+    def counts(self):
+        """ {state name: numbers in that state} over len(self) """
+        totals = [0, 0, 0, 0]
+        data = bytes(self._bits)
+        for value in set(data):
+            found = data.count(value)
+            for slot in range(4):
+                totals[(value >> (slot * 2)) & 3] += found
+        return dict(zip(self.STATES, totals))
+
+    def load(self):
+        with open(self.path, 'rb') as f:
+            self._bits = bytearray(zlib.decompress(f.read()))
+        self.highest = self._find_highest()
+
+    def save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp = '{0}.{1}.tmp'.format(self.path, threading.get_ident())
+        with self._lock:
+            data = zlib.compress(bytes(self._bits))
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, self.path)
+
+
+class Discovery:
+    """
+        finds new carriers by probing DOT numbers with SaferPage
+        @index: DotIndex or the path of one
+        @window: numbers above the highest valid one probed every run,
+            new registrations get the next numbers, so the ones found
+            missing there are probed again later
+        @timeout: per fetch
+
+        after the window, numbers never probed are taken
+        downwards from the highest valid one
+    """
+    DEFAULT_WINDOW = 5000
+
+    def __init__(self, index, window=DEFAULT_WINDOW, timeout=BasePage.DEFAULT_TIMEOUT):
+        self.index = index if isinstance(index, DotIndex) else DotIndex(index)
+        self.window = window
+        self.timeout = timeout
+        self.probed = 0
+        self.found = 0
+        self.errors = 0
+
+    def seed(self, manager):
+        """
+            @manager: FMCSAManager
+            mark the numbers already stored, and the negative cache's, in the index
+        """
+        for (dot_number,) in manager.shard.query(SaferReport.dot_number).distinct():
+            if dot_number and dot_number.isdigit():
+                self.index.set(dot_number, DotIndex.VALID)
+        for dot_number, outcome in manager.shard.query(NegativeEntry.dot_number, NegativeEntry.outcome):
+            if dot_number and dot_number.isdigit():
+                self.index.set(dot_number, DotIndex.NOT_FOUND if outcome == NegativeCache.NOT_FOUND
+                               else DotIndex.INACTIVE)
+
+    def candidates(self, limit):
+        """
+            up to @limit numbers to probe next, most promising first
+        """
+        top = self.index.highest or 0
+        numbers = [dot_number for dot_number in range(top + 1, top + 1 + self.window)
+                   if self.index.get(dot_number) in (DotIndex.UNKNOWN, DotIndex.NOT_FOUND)][:limit]
+        dot_number = top
+        while len(numbers) < limit and dot_number > 0:
+            if self.index.get(dot_number) == DotIndex.UNKNOWN:
+                numbers.append(dot_number)
+            dot_number -= 1
+        return numbers
+
+    def record(self, dot_number, page):
+        """
+            @page: the fetched SaferPage, or the exception fetching it raised
+            returns the state stored, None when the probe told nothing
+            the negative cache, when pages have one, is brought up to date
+        """
+        state = None
+        try:
+            if isinstance(page, Exception):
+                raise page
+            if page._is_valid(page.dot_number):
+                state = DotIndex.VALID
+        except RecordNotFound:
+            state = DotIndex.NOT_FOUND
+        except BadDOTNumber:
+            state = DotIndex.INACTIVE
+        except Exception as e:
+            print("Caught Exception probing {0}: {1}".format(dot_number, str(e)))
+            self.errors += 1
+        if state is not None:
+            self.index.set(dot_number, state)
+            self._update_negative(dot_number, state)
+            self.probed += 1
+            if state == DotIndex.VALID:
+                self.found += 1
+        return state
+
+    @staticmethod
+    def _update_negative(dot_number, state):
+        cache = SaferPage.negative_cache
+        if cache is None:
+            return
+        dot_number = str(dot_number)
+        if state == DotIndex.VALID:
+            cache.invalidate(dot_number)
+        elif state == DotIndex.NOT_FOUND:
+            cache.put(dot_number, NegativeCache.NOT_FOUND)
+        elif state == DotIndex.INACTIVE:
+            cache.put(dot_number, NegativeCache.INACTIVE)
+
+    async def probe(self, fetcher, limit=1000):
+        """
+            @fetcher: AsyncFetcher, its caps bound the probes in flight
+            probe the next @limit candidates and save the index
+            returns the valid numbers found
+            probes skip the negative cache, new registrations take numbers
+            it still remembers as not found, record() updates it instead
+        """
+        numbers = self.candidates(limit)
+        pages = await SaferPage.fetch_many([str(dot_number) for dot_number in numbers], fetcher, self.timeout,
+                                           negative_cache=None)
+        found = [dot_number for dot_number, page in zip(numbers, pages)
+                 if self.record(dot_number, page) == DotIndex.VALID]
+        if self.index.path is not None:
+            self.index.save()
+        return found
+
+    def stats(self):
+        stats = {
+            'probed': self.probed,
+            'found': self.found,
+            'errors': self.errors,
+            'highest': self.index.highest
+        }
+        stats.update(self.index.counts())
+        return stats
@@ -1,12 +1,10 @@
-from io import StringIO
-from lxml import etree
 import re
 from scraper.models.fmcsa.scraper_property import (
     ScraperRowProperty,
     ScraperTableProperty,
     ScraperRevocationProperty
 )
-from .base_page import BasePage
+from .base_page import BasePage, skip_unchanged
 from scraper.models.fmcsa.exceptions import NoScrapedRows, RecordNotFound
 from scraper.models.fmcsa.report import (
     ActiveInsuranceReport,
@@ -16,29 +14,54 @@ from scraper.models.fmcsa.report import (
     RejectedInsuranceReport,
     RevocationReport
 )
-from scraper.models.fmcsa import FMCSAManager
 import transaction
 from sqlalchemy.exc import IntegrityError
 from scraper.config import Settings
 
 
+def no_data_watch(message):
+    """
+        row_stream watch for _has_data's marker, raises NoScrapedRows(@message)
+        when the first //strong/font[@color="red"] before the table
+        reads "No Data Available"
+    """
+    seen = []
+
+    def watch(element):
+        if seen or element.tag != 'font' or element.get('color') != 'red':
+            return
+        parent = element.getparent()
+        if parent is None or parent.tag != 'strong':
+            return
+        seen.append(element)
+        if re.match(r'^No Data Available$', str(element.text).strip()):
+            raise NoScrapedRows(message)
+    return watch
+
+
 class InsuranceBasePage(BasePage):
-    def __init__(self, dot_number, timeout=BasePage.DEFAULT_TIMEOUT):
-        super().__init__()
+    def __init__(self, dot_number, timeout=BasePage.DEFAULT_TIMEOUT, manager=None):
+        super().__init__(manager=manager)
         self.dot_number = dot_number
         self._set_url()
         # if get html fails urllib or socket.timeout error is raised
-        self.html_doc = super()._get_html(self.url, timeout)
-        self.root = etree.parse(StringIO(self.html_doc), self.parser)
-        self.manager = FMCSAManager()
+        self._fetch(timeout)
 
-    def _has_data(self):
+    def _has_data(self, name=None):
         """
             sub pages with no data
             are indicated with strong red font as
             "No Data Available"
+            @name: the table descriptor to be read, when given only the
+                first marker before that table counts, markers in or after
+                it are ignored; without the table the whole page is checked,
+                the rule streamed pages follow, see _rows
         """
-        no_records = self.root.xpath('//strong/font[@color="red"]')
+        tables = getattr(type(self), name).xpath(self.root) if name is not None else []
+        if tables:
+            no_records = tables[0].xpath('preceding::font[@color="red"][parent::strong]')
+        else:
+            no_records = self.root.xpath('//strong/font[@color="red"]')
         if no_records and len(no_records):
             result = str(no_records[0].text)
             if re.match(r'^No Data Available$', result.strip()):
@@ -47,10 +70,36 @@ class InsuranceBasePage(BasePage):
                 return True
         return True
 
+    def _rows(self, name, message):
+        """
+            the rows of table descriptor @name,
+            raises NoScrapedRows(@message) on a page with no data,
+            before any row is read, see _has_data;
+            a streamed page is checked in the same pass as its rows
+        """
+        if getattr(type(self), name).streams(self):
+            return self.iter_rows(name, watch=no_data_watch(message))
+        if not self._has_data(name):
+            raise NoScrapedRows(message)
+        return self.iter_rows(name)
+
     def _set_url(self):
         url_data = Settings().fmcsa_urls
         self.url = url_data['insurance_base']
 
+    def _observe(self, changed):
+        """
+            one scheduler observation per crawl of this page,
+            @changed: a row not stored before was added
+        """
+        if self.manager.scheduler is None:
+            return
+        try:
+            self.manager.observe(self.dot_number, self.report_type, changed)
+            transaction.commit()
+        except Exception as e:
+            print("Caught Exception on transaction commit: {0}".format(str(e)))
+
     def create_report(self):
         pass
 
@@ -61,6 +110,7 @@ class InsuranceHistoryPage(InsuranceBasePage):
         @expr:xpath expression for html table
         @fields:field names used in orm
     """
+    report_type = InsuranceHistoryReport
     insurance_policies = ScraperRowProperty(
         expr='//font/table[4]',
         fields=['form_name',
@@ -79,6 +129,7 @@ class InsuranceHistoryPage(InsuranceBasePage):
         url_data = Settings().fmcsa_urls
         self.url = url_data['insurance_history']
 
+    @skip_unchanged
     def create_report(self):
         """
             @insurance_policies: list of dictionaries
@@ -86,9 +137,9 @@ class InsuranceHistoryPage(InsuranceBasePage):
         """
         if not self._have_dot_number(self.dot_number):
             raise RecordNotFound('no safer record stored for {0}'.format(self.dot_number))
-        if not self._has_data():
-            raise NoScrapedRows('{0} has no insurance history'.format(self.dot_number))
-        for row in self.insurance_policies:
+        changed = False
+        stored = self.manager.insurance_keys(self.dot_number, cls=self.report_type)
+        for row in self._rows('insurance_policies', '{0} has no insurance history'.format(self.dot_number)):
             report = InsuranceHistoryReport()
             report.dot_number = self.dot_number
             report.form_name = row.get('form_name')
@@ -101,20 +152,25 @@ class InsuranceHistoryPage(InsuranceBasePage):
             report.date_to = row.get('date_to')
             report.status = row.get('status')
             try:
-                self.manager.add_insurance_report(self.dot_number, report, cls=InsuranceHistoryReport)
+                if self.manager.add_insurance_report(self.dot_number, report, cls=InsuranceHistoryReport, stored=stored):
+                    changed = True
             except Exception as e:
                 print("Caught Exception on transaction commit: {0}".format(str(e)))
+                self.commit_failed = True
                 continue
             else:
                 try:
                     transaction.commit()
                 except IntegrityError as e:
                     print("IntegrityError: {0}, continuing".format(str(e)))
+                    self.commit_failed = True
                     transaction.abort()
                     continue
+        self._observe(changed)
 
 
 class ActiveInsurancePage(InsuranceBasePage):
+    report_type = ActiveInsuranceReport
     insurance_policies = ScraperRowProperty(
         expr='//font/table[4]',
         fields=['form_name',
@@ -133,10 +189,11 @@ class ActiveInsurancePage(InsuranceBasePage):
         url_data = Settings().fmcsa_urls
         self.url = url_data['insurance_active']
 
+    @skip_unchanged
     def create_report(self):
-        if not self._has_data():
-            raise NoScrapedRows("{0} has no active insurance data".format(self.dot_number))
-        for row in self.insurance_policies:
+        changed = False
+        stored = self.manager.insurance_keys(self.dot_number, cls=self.report_type)
+        for row in self._rows('insurance_policies', "{0} has no active insurance data".format(self.dot_number)):
             report = ActiveInsuranceReport()
             report.dot_number = self.dot_number
             report.form_name = row.get('form_name')
@@ -149,20 +206,25 @@ class ActiveInsurancePage(InsuranceBasePage):
             report.effective_date = row.get('effective_date')
             report.cancellation_date = row.get('cancellation_date')
             try:
-                self.manager.add_insurance_report(self.dot_number, report, cls=ActiveInsuranceReport)
+                if self.manager.add_insurance_report(self.dot_number, report, cls=ActiveInsuranceReport, stored=stored):
+                    changed = True
             except Exception as e:
                 print("Caught Exception on transaction commit: {0}".format(str(e)))
+                self.commit_failed = True
                 continue
             else:
                 try:
                     transaction.commit()
                 except IntegrityError as e:
                     print("IntegrityError: {0}, continuing".format(str(e)))
+                    self.commit_failed = True
                     transaction.abort()
                     continue
+        self._observe(changed)
 
 
 class RejectedInsurancePage(InsuranceBasePage):
+    report_type = RejectedInsuranceReport
     insurance_policies = ScraperTableProperty(
         expr='//font/table[4]',
         fields=['form_name',
@@ -180,10 +242,11 @@ class RejectedInsurancePage(InsuranceBasePage):
         url_data = Settings().fmcsa_urls
         self.url = url_data['insurance_rejected']
 
+    @skip_unchanged
     def create_report(self):
-        if not self._has_data():
-            raise NoScrapedRows("{0} has no insurance history data".format(self.dot_number))
-        for row in self.insurance_policies:
+        changed = False
+        stored = self.manager.insurance_keys(self.dot_number, cls=self.report_type)
+        for row in self._rows('insurance_policies', "{0} has no insurance history data".format(self.dot_number)):
             report = RejectedInsuranceReport()
             report.dot_number = self.dot_number
             report.form_name = row.get('form_name')
@@ -195,20 +258,25 @@ class RejectedInsurancePage(InsuranceBasePage):
             report.received_date = row.get('received_date')
             report.rejected_date = row.get('rejected_date')
             try:
-                self.manager.add_insurance_report(self.dot_number, report, cls=RejectedInsuranceReport)
+                if self.manager.add_insurance_report(self.dot_number, report, cls=RejectedInsuranceReport, stored=stored):
+                    changed = True
             except Exception as e:
                 print("Caught Exception on transaction commit: {0}".format(str(e)))
+                self.commit_failed = True
                 continue
             else:
                 try:
                     transaction.commit()
                 except IntegrityError as e:
                     print("IntegrityError: {0}, continuing".format(str(e)))
+                    self.commit_failed = True
                     transaction.abort()
                     continue
+        self._observe(changed)
 
 
 class AuthorityHistoryPage(InsuranceBasePage):
+    report_type = AuthorityHistoryReport
     policies = ScraperTableProperty(
         expr='//font/table[4]',
         fields=['auth_type',
@@ -223,10 +291,11 @@ class AuthorityHistoryPage(InsuranceBasePage):
         url_data = Settings().fmcsa_urls
         self.url = url_data['authority_history']
 
+    @skip_unchanged
     def create_report(self):
-        if not self._has_data():
-            raise NoScrapedRows("{0} has no insurance history data".format(self.dot_number))
-        for row in self.policies:
+        changed = False
+        stored = self.manager.insurance_keys(self.dot_number, cls=self.report_type)
+        for row in self._rows('policies', "{0} has no insurance history data".format(self.dot_number)):
             report = AuthorityHistoryReport()
             report.dot_number = self.dot_number
             report.auth_type = row.get('auth_type')
@@ -235,20 +304,25 @@ class AuthorityHistoryPage(InsuranceBasePage):
             report.dispostion = row.get('dispostion')
             report.dispostion_date = row.get('dispostion_date')
             try:
-                self.manager.add_insurance_report(self.dot_number, report, cls=AuthorityHistoryReport)
+                if self.manager.add_insurance_report(self.dot_number, report, cls=AuthorityHistoryReport, stored=stored):
+                    changed = True
             except Exception as e:
                 print("Caught Exception on transaction commit: {0}".format(str(e)))
+                self.commit_failed = True
                 continue
             else:
                 try:
                     transaction.commit()
                 except IntegrityError as e:
                     print("IntegrityError: {0}, continuing".format(str(e)))
+                    self.commit_failed = True
                     transaction.abort()
                     continue
+        self._observe(changed)
 
 
 class PendingApplicationPage(InsuranceBasePage):
+    report_type = PendingApplicationReport
     policies = ScraperRowProperty(
         expr='//font/table[4]',
         fields=['auth_type',
@@ -262,10 +336,11 @@ class PendingApplicationPage(InsuranceBasePage):
         url_data = Settings().fmcsa_urls
         self.url = url_data['insurance_pending']
 
+    @skip_unchanged
     def create_report(self):
-        if not self._has_data():
-            raise NoScrapedRows("{0} has no insurance history data".format(self.dot_number))
-        for row in self.policies:
+        changed = False
+        stored = self.manager.insurance_keys(self.dot_number, cls=self.report_type)
+        for row in self._rows('policies', "{0} has no insurance history data".format(self.dot_number)):
             report = PendingApplicationReport()
             report.dot_number = self.dot_number
             report.auth_type = row.get('auth_type')
@@ -273,20 +348,25 @@ class PendingApplicationPage(InsuranceBasePage):
             report.insurance = row.get('insurance')
             report.boc_3 = row.get('boc_3')
             try:
-                self.manager.add_insurance_report(self.dot_number, report, cls=PendingApplicationPage)
+                if self.manager.add_insurance_report(self.dot_number, report, cls=PendingApplicationReport, stored=stored):
+                    changed = True
             except Exception as e:
                 print("Caught Exception on transaction commit: {0}".format(str(e)))
+                self.commit_failed = True
                 continue
             else:
                 try:
                     transaction.commit()
                 except IntegrityError as e:
                     print("IntegrityError: {0}, continuing".format(str(e)))
+                    self.commit_failed = True
                     transaction.abort()
                     continue
+        self._observe(changed)
 
 
 class RevocationPage(InsuranceBasePage):
+    report_type = RevocationReport
     policies = ScraperRevocationProperty(
         expr='//font/table[4]',
         fields=['auth_type',
@@ -300,10 +380,11 @@ class RevocationPage(InsuranceBasePage):
         url_data = Settings().fmcsa_urls
         self.url = url_data['insurance_revocation']
 
+    @skip_unchanged
     def create_report(self):
-        if not self._has_data():
-            raise NoScrapedRows("{0} has no insurance history data".format(self.dot_number))
-        for row in self.policies:
+        changed = False
+        stored = self.manager.insurance_keys(self.dot_number, cls=self.report_type)
+        for row in self._rows('policies', "{0} has no insurance history data".format(self.dot_number)):
             report = RevocationReport()
             report.dot_number = self.dot_number
             report.auth_type = row.get('auth_type')
@@ -311,14 +392,18 @@ class RevocationPage(InsuranceBasePage):
             report.effective_date = row.get('effective_date')
             report.reason = row.get('reason')
             try:
-                self.manager.add_insurance_report(self.dot_number, report, cls=RevocationReport)
+                if self.manager.add_insurance_report(self.dot_number, report, cls=RevocationReport, stored=stored):
+                    changed = True
             except Exception as e:
                 print("Caught Exception on transaction commit: {0}".format(str(e)))
+                self.commit_failed = True
                 continue
             else:
                 try:
                     transaction.commit()
                 except IntegrityError as e:
                     print("IntegrityError: {0}, continuing".format(str(e)))
+                    self.commit_failed = True
                     transaction.abort()
                     continue
+        self._observe(changed)
@@ -1,14 +1,12 @@
-from io import StringIO
-from lxml import etree
 from scraper.models.fmcsa.scraper_property import ScraperProperty
-from .base_page import BasePage
+from .base_page import BasePage, skip_unchanged
 from scraper.models.fmcsa.exceptions import NoScrapedRows, TimeoutError, RecordNotFound
-from scraper.models.fmcsa import FMCSAManager
 from scraper.models.fmcsa.report import LicenseReport
 import transaction
 
 
 class LicensePage(BasePage):
+    report_type = LicenseReport
     common_authority_status = ScraperProperty(expr='//font/table[6]/tr[2]/td[1]/center/font')
     contract_authority_status = ScraperProperty(expr='//font/table[6]/tr[3]/td[1]/center/font')
     broker_authority_status = ScraperProperty(expr='//font/table[6]/tr[4]/td[1]/center/font')
@@ -26,15 +24,16 @@ class LicensePage(BasePage):
     bond_required = ScraperProperty(expr='//font/table[8]/tr[4]/td[1]/center/font')
     bond_on_file = ScraperProperty(expr='//font/table[8]/tr[4]/td[2]/center/font')
 
-    def __init__(self, dot_number, timeout=BasePage.DEFAULT_TIMEOUT):
-        super().__init__()
+    def __init__(self, dot_number, timeout=BasePage.DEFAULT_TIMEOUT, manager=None):
+        super().__init__(manager=manager)
         self.dot_number = dot_number
-        url = 'http://li-public.fmcsa.dot.gov/LIVIEW/pkg_carrquery.prc_getdetail'
-        self.html_doc = super()._get_html(url, timeout)
-        if not self.html_doc:
+        self._set_url()
+        self._fetch(timeout)
+        if not self.body_size:
             raise TimeoutError("Timeout exceeded getting page for {0}".format(dot_number))
-        self.root = etree.parse(StringIO(self.html_doc), self.parser)
-        self.manager = FMCSAManager()
+
+    def _set_url(self):
+        self.url = self.url_data['insurance_detail']  # http://li-public.fmcsa.dot.gov/LIVIEW/pkg_carrquery.prc_getdetail
 
     def _has_data(self, dot_number):
         # if the html returned is the license detail page
@@ -45,6 +44,7 @@ class LicensePage(BasePage):
         else:
             return False
 
+    @skip_unchanged
     def create_report(self):
         if not self._has_data(self.dot_number):
             raise NoScrapedRows('{0} has no license data'.format(self.dot_number))
@@ -73,3 +73,4 @@ class LicensePage(BasePage):
             transaction.commit()
         except Exception as e:
             print("Caught Exception on transaction commit: {0}".format(str(e)))
+            self.commit_failed = True
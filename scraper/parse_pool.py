@@ -0,0 +1,208 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from scraper.models.fmcsa.report import InsuranceHistoryReport, SaferReport
+from .base_page import skip_unchanged
+from .safer_page import SaferPage
+import transaction
+
+
+def report_fields(report):
+    """
+        @report: report built by a page
+        returns its set column values as a plain dict
+    """
+    fields = {}
+    for column in report.__mapper__.column_attrs:
+        value = getattr(report, column.key)
+        if value is not None:
+            fields[column.key] = value
+    return fields
+
+
+class NegativeOutcome:
+    """
+        stands in for the NegativeCache in a parse worker,
+        keeps the outcome SaferPage._is_valid read off the page
+    """
+    def __init__(self):
+        self.outcome = None
+
+    def check(self, dot_number):
+        pass
+
+    def put(self, dot_number, outcome):
+        self.outcome = outcome
+
+
+class ReportCollector:
+    """
+        stands in for FMCSAManager in a parse worker
+        keeps what the page would have added as
+        (manager method, report class, report fields)
+    """
+    scheduler = None
+
+    def __init__(self):
+        self.reports = []
+
+    def add_scraped_report(self, dot_number, report, cls=SaferReport):
+        self.reports.append(('add_scraped_report', cls, report_fields(report)))
+        return True
+
+    def insurance_keys(self, dot_number, cls=InsuranceHistoryReport):
+        # the parent reads them when it stores the rows
+        return None
+
+    def add_insurance_report(self, dot_number, report, cls=InsuranceHistoryReport, stored=None):
+        self.reports.append(('add_insurance_report', cls, report_fields(report)))
+        # whether the row is new is decided when the parent stores it
+        return True
+
+    def observe(self, dot_number, cls, changed):
+        pass
+
+
+def extract_reports(page_cls, dot_number, body, attributes):
+    """
+        runs in a parse worker
+        @body: the page's raw bytes
+        @attributes: set on the page, e.g. have_safer_record
+        parses the page, runs its create_report so the ScraperProperty
+        extraction and the report validators run here,
+        returns the collected reports, see ReportCollector
+    """
+    collector = ReportCollector()
+    # dead numbers are remembered by the parent, see ParsePool.result
+    negative = NegativeOutcome()
+    page = page_cls.from_html(dot_number, body, manager=collector, negative_cache=negative, **attributes)
+    try:
+        page.create_report()
+    except Exception as e:
+        # pickled back with the exception
+        e.negative_outcome = negative.outcome
+        raise
+    return collector.reports
+
+
+@skip_unchanged
+def persist_reports(page, reports):
+    """
+        add the reports extracted by a worker through the page's manager
+        decorated like create_report, so unchanged pages are only counted
+        and the html cache is marked once the reports are stored
+    """
+    # insurance rows are observed once per page, scraped reports by the manager
+    changed = None
+    # {report class: its stored unique keys}, read once per page
+    stored = {}
+    for method, cls, fields in reports:
+        report = cls()
+        for name, value in fields.items():
+            setattr(report, name, value)
+        try:
+            if method == 'add_insurance_report':
+                if cls not in stored:
+                    stored[cls] = page.manager.insurance_keys(page.dot_number, cls=cls)
+                added = page.manager.add_insurance_report(page.dot_number, report, cls=cls, stored=stored[cls])
+            else:
+                added = getattr(page.manager, method)(page.dot_number, report, cls=cls)
+            transaction.commit()
+        except Exception as e:
+            print("Caught Exception on transaction commit: {0}".format(str(e)))
+            page.commit_failed = True
+            transaction.abort()
+        else:
+            if method == 'add_insurance_report':
+                changed = bool(changed or added)
+    if changed is not None:
+        page._observe(changed)
+
+
+class ParsePool:
+    """
+        parses fetched pages and builds their reports in worker processes,
+        the parent only persists the returned field dicts
+        @max_workers: worker processes, one per core by default
+
+        pages must be fetched without BasePage.streaming,
+        their html is sent to the workers as bytes
+    """
+    def __init__(self, max_workers=None):
+        self.executor = ProcessPoolExecutor(max_workers)
+        self.parsed = 0
+        self.skipped = 0
+
+    def _job(self, page):
+        if page.html_body is None:
+            raise ValueError("{0} was streamed and has no html to send".format(type(page).__name__))
+        attributes = {}
+        if not isinstance(page, SaferPage):
+            # the lookup needs the database, answer it here
+            attributes['have_safer_record'] = page._have_dot_number(page.dot_number)
+        return extract_reports, type(page), page.dot_number, page.html_body, attributes
+
+    @staticmethod
+    def result(page, future):
+        """
+            reports extracted for @page by @future
+            a dead DOT number the worker read off a SAFER page goes to
+            the negative cache, other failures are never remembered
+        """
+        try:
+            return future.result()
+        except Exception as e:
+            outcome = getattr(e, 'negative_outcome', None)
+            if outcome is not None and isinstance(page, SaferPage):
+                page._remember_negative(outcome)
+            raise
+
+    def create_report(self, page):
+        """
+            same as page.create_report, raises what it raises
+        """
+        if page.unchanged:
+            self.skipped += 1
+            return persist_reports(page, [])
+        reports = self.result(page, self.executor.submit(*self._job(page)))
+        self.parsed += 1
+        return persist_reports(page, reports)
+
+    async def create_report_async(self, page):
+        if page.unchanged:
+            self.skipped += 1
+            return persist_reports(page, [])
+        future = asyncio.wrap_future(self.executor.submit(*self._job(page)))
+        await asyncio.wait([future])
+        reports = self.result(page, future)
+        self.parsed += 1
+        return persist_reports(page, reports)
+
+    def create_reports(self, pages):
+        """
+            parse @pages in parallel, persist in order
+            returns a list with the exception raised for each page or None
+        """
+        futures = [None if page.unchanged else self.executor.submit(*self._job(page)) for page in pages]
+        outcome = []
+        for page, future in zip(pages, futures):
+            try:
+                reports = [] if future is None else self.result(page, future)
+            except Exception as e:
+                outcome.append(e)
+                continue
+            if future is None:
+                self.skipped += 1
+            else:
+                self.parsed += 1
+            persist_reports(page, reports)
+            outcome.append(None)
+        return outcome
+
+    def close(self):
+        self.executor.shutdown()
+
+    def stats(self):
+        return {
+            'parsed': self.parsed,
+            'skipped': self.skipped
+        }
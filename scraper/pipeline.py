@@ -0,0 +1,170 @@
+import asyncio
+import functools
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from scraper.models.fmcsa import FMCSAManager
+from scraper.models.fmcsa.exceptions import RecordNotFound
+from .base_page import BasePage
+from .parse_pool import ParsePool, ReportCollector, extract_reports, persist_reports
+from .safer_page import SaferPage
+
+
+class Stage:
+    """
+        one step of a Pipeline
+        @name
+        @workers: tasks taking items from the stage's queue
+        @queue_size: items waiting at most, a full queue
+            blocks the stage before it
+    """
+    def __init__(self, name, workers, queue_size):
+        self.name = name
+        self.workers = workers
+        self.queue = asyncio.Queue(queue_size)
+        self.processed = 0
+        self.failed = 0
+        self.busy = 0
+        self.started = None
+
+    def stats(self):
+        elapsed = time.monotonic() - self.started if self.started else 0
+        return {
+            'workers': self.workers,
+            'busy': self.busy,
+            'depth': self.queue.qsize(),
+            'capacity': self.queue.maxsize,
+            'processed': self.processed,
+            'failed': self.failed,
+            'per_second': round(self.processed / elapsed, 2) if elapsed else 0.0
+        }
+
+
+class Pipeline:
+    """
+        fetch -> parse -> persist with a bounded queue in front of each stage
+        so a slow database never piles up fetched pages and a slow site
+        never leaves the database idle for long
+        @fetcher: AsyncFetcher shared by the fetch workers
+        @page_classes: pages fetched for each DOT number
+        @fetchers, @parsers, @persisters: workers per stage
+        @queue_size: items each stage's queue holds
+        @parse_pool: ParsePool whose processes parse and validate,
+            threads of this process are used without one
+        @timeout: per fetch
+
+        parsing runs each page's create_report against a ReportCollector,
+        so the report validators run in the parse stage,
+        the persist stage only adds the collected reports
+        with one FMCSAManager per persist thread
+    """
+    DEFAULT_QUEUE_SIZE = 64
+
+    def __init__(self, fetcher, page_classes=(SaferPage,), fetchers=32, parsers=4, persisters=1,
+                 queue_size=DEFAULT_QUEUE_SIZE, parse_pool=None, timeout=BasePage.DEFAULT_TIMEOUT):
+        self.fetcher = fetcher
+        self.page_classes = page_classes
+        self.timeout = timeout
+        self.stages = [
+            Stage('fetch', fetchers, queue_size),
+            Stage('parse', parsers, queue_size),
+            Stage('persist', persisters, queue_size)
+        ]
+        self._own_parse_executor = parse_pool is None
+        if parse_pool is not None:
+            self._parse_executor = parse_pool.executor
+        else:
+            self._parse_executor = ThreadPoolExecutor(parsers)
+        self._persist_executor = ThreadPoolExecutor(persisters)
+        self._local = threading.local()
+        self.errors = Counter()
+
+    def _manager(self):
+        # sessions and zope transactions belong to one thread
+        manager = getattr(self._local, 'manager', None)
+        if manager is None:
+            manager = self._local.manager = FMCSAManager()
+        return manager
+
+    async def _fetch(self, item):
+        dot_number, page_cls = item
+        # pages are only persisted in the persist stage
+        page = await page_cls.fetch(dot_number, self.fetcher, self.timeout,
+                                    manager=ReportCollector(), streaming=False)
+        return page, None
+
+    async def _parse(self, item):
+        page, _ = item
+        if page.unchanged:
+            return page, []
+        loop = asyncio.get_running_loop()
+        body = page.html_body
+        # the safer record is checked in the persist stage, which has the database
+        future = loop.run_in_executor(self._parse_executor, functools.partial(
+            extract_reports, type(page), page.dot_number, body, {'have_safer_record': True}))
+        await asyncio.wait([future])
+        return page, ParsePool.result(page, future)
+
+    def _store(self, page, reports):
+        page.manager = self._manager()
+        if reports and not isinstance(page, SaferPage) and not page._have_dot_number(page.dot_number):
+            raise RecordNotFound('no safer record stored for {0}'.format(page.dot_number))
+        persist_reports(page, reports)
+
+    async def _persist(self, item):
+        page, reports = item
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._persist_executor, self._store, page, reports)
+
+    async def _work(self, stage, step, next_stage):
+        while True:
+            item = await stage.queue.get()
+            stage.busy += 1
+            try:
+                result = await step(item)
+            except Exception as e:
+                stage.failed += 1
+                self.errors[type(e).__name__] += 1
+            else:
+                stage.processed += 1
+                if next_stage is not None:
+                    # waits while the next stage is full
+                    await next_stage.queue.put(result)
+            finally:
+                stage.busy -= 1
+                stage.queue.task_done()
+
+    async def run(self, dot_numbers):
+        """
+            fetch, parse and persist every page of @dot_numbers
+            returns self.stats() once every queue is drained
+        """
+        steps = (self._fetch, self._parse, self._persist)
+        next_stages = self.stages[1:] + [None]
+        tasks = []
+        for stage, step, next_stage in zip(self.stages, steps, next_stages):
+            stage.started = time.monotonic()
+            tasks.extend(asyncio.ensure_future(self._work(stage, step, next_stage))
+                         for _ in range(stage.workers))
+        try:
+            for dot_number in dot_numbers:
+                for page_cls in self.page_classes:
+                    await self.stages[0].queue.put((dot_number, page_cls))
+            for stage in self.stages:
+                await stage.queue.join()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        return self.stats()
+
+    def close(self):
+        if self._own_parse_executor:
+            self._parse_executor.shutdown()
+        self._persist_executor.shutdown()
+
+    def stats(self):
+        stats = {stage.name: stage.stats() for stage in self.stages}
+        stats['errors'] = dict(self.errors)
+        return stats
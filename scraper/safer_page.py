@@ -1,5 +1,3 @@
-from io import StringIO
-from lxml import etree
 import re
 from scraper.models.fmcsa.scraper_property import (
     ScraperProperty,
@@ -10,8 +8,9 @@ from scraper.models.fmcsa.exceptions import(
     BadDOTNumber,
     RecordNotFound
 )
-from .base_page import BasePage
-from scraper.models.fmcsa import FMCSAManager
+from scraper.models.fmcsa.cache import NegativeCache
+from scraper.models.fmcsa.extraction_plan import ExtractionPlan
+from .base_page import BasePage, skip_unchanged
 from scraper.models.fmcsa.report import SaferReport
 import transaction
 
@@ -51,6 +50,29 @@ class SaferPage(BasePage):
                 Conditional - carrier was out of compliance with one or more safety requirements.
                 Unsatisfactory - evidence of substantial noncompliance with safety requirements.
     """
+    report_type = SaferReport
+    # th label next to each field's value cell, opt in, see ExtractionPlan
+    LABELS = {
+        'address': ('Physical Address:', 'text()'),
+        'carrier_operation': 'Operating Status:',
+        'dba_name': 'DBA Name:',
+        'driver_total': 'Drivers:',
+        'duns_number': 'DUNS Number:',
+        'entity_type': 'Entity Type:',
+        'legal_name': 'Legal Name:',
+        'mailing_address': ('Mailing Address:', 'text()'),
+        'mc_number': 'MC/MX/FF Number(s):',
+        'mcs150_date': 'MCS-150 Form Date:',
+        'mcs150_mileage_and_year': 'MCS-150 Mileage (Year):',
+        'nbr_power_unit': 'Power Units:',
+        'oos_date': 'Out of Service Date:',
+        'rating': 'Rating:',
+        'rating_date': 'Rating Date:',
+        'rating_type': 'Type:',
+        'review_date': 'Review Date:',
+        'state_id': 'State Carrier ID Number:',
+        'telephone': 'Phone:'
+    }
     address = ScraperProperty(
         expr='//table/tr[2]/td/table/tr[2]/td/center[1]/table/tr[6]/td/text()'
     )
@@ -199,31 +221,37 @@ class SaferPage(BasePage):
         expr='//table//tr[2]/td/table/tr[2]/td/center[6]/table/tr[4]/td[1]'
     )
 
-    def __init__(self, dot_number, timeout=BasePage.DEFAULT_TIMEOUT):
+    def __init__(self, dot_number, timeout=BasePage.DEFAULT_TIMEOUT, manager=None):
         """
             @dot_number : use DOT number for search
             @timeout: override default timeout of 120 seconds
+            @manager: FMCSAManager to share, one is created if not given
             set dot, timeout, data manager and HTML for instance
+            SaferPage.from_html builds one without fetching
         """
-        super().__init__()
+        super().__init__(manager=manager)
         self.dot_number = dot_number
-        url = self.url_data['safer']  # http://safer.fmcsa.dot.gov/query.asp'
-        self.html_doc = super()._get_html(url, timeout)
-        self.root = etree.parse(StringIO(self.html_doc), self.parser)
-        self.manager = FMCSAManager()
+        self._set_url()
+        self._fetch(timeout)
+
+    def _set_url(self):
+        self.url = self.url_data['safer']  # http://safer.fmcsa.dot.gov/query.asp'
 
     def _is_valid(self, dot_number):
         """
             @dot_number: DOT to be searched
             if page indicates no record, we raise BadDOTNumber
+            and remember it in the negative cache
             else return true
         """
         valid_record = self.root.xpath('//table/tr/td/font/text()')
 
         if valid_record and len(valid_record):
             if re.match(r'^No records matching', valid_record[0].strip()):
+                self._remember_negative(NegativeCache.NOT_FOUND)
                 raise RecordNotFound("{0} is not a valid DOT number".format(dot_number))
             elif re.match(r'^The record matching', valid_record[0].strip()):
+                self._remember_negative(NegativeCache.INACTIVE)
                 raise BadDOTNumber(
                     '{0} is not a currently active DOT number'.format(dot_number)
                 )
@@ -251,6 +279,7 @@ class SaferPage(BasePage):
             self.mcs150_mileage = None
             self.mcs150_mileage_year = None
 
+    @skip_unchanged
     def create_safer_report(self):
         """
             public method to create SaferReport
@@ -312,3 +341,14 @@ class SaferPage(BasePage):
             transaction.commit()
         except Exception as e:
             print("Caught Exception on transaction commit: {0}".format(str(e)))
+            self.commit_failed = True
+
+    # the name every other page uses
+    create_report = create_safer_report
+
+
+# the descriptors share the center[N] anchors, resolved once per page;
+# LABELS are opt in, ExtractionPlan(SaferPage, SaferPage.LABELS) reads them
+# from one pass over the th cells, use it once benchmarks.plan --labels
+# finds no differences on a recorded corpus
+SaferPage.extraction_plan = ExtractionPlan(SaferPage)
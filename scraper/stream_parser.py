@@ -0,0 +1,43 @@
+import hashlib
+from lxml import etree
+from scraper.models.fmcsa.html_parser import ENCODING, new_parser
+
+
+class StreamingParse:
+    """
+        sink for a response body
+        chunks go to an lxml feed parser as they arrive,
+        so parsing overlaps the transfer and no full copy of the page is held
+        @keep: also keep the raw chunks, needed when the html cache stores the body
+
+        size: bytes fed
+        digest(): sha256 of the bytes fed
+    """
+    ENCODING = ENCODING
+
+    def __init__(self, keep=False):
+        # pages stream concurrently on one thread, each needs its own parser
+        self.parser = new_parser()
+        self.size = 0
+        self._hash = hashlib.sha256()
+        self._chunks = [] if keep else None
+
+    def feed(self, chunk):
+        self.parser.feed(chunk)
+        self._hash.update(chunk)
+        self.size += len(chunk)
+        if self._chunks is not None:
+            self._chunks.append(chunk)
+
+    def close(self):
+        """ finish parsing, returns the document as an ElementTree """
+        return etree.ElementTree(self.parser.close())
+
+    def digest(self):
+        return self._hash.hexdigest()
+
+    def body(self):
+        """ the raw body, only when created with keep """
+        if self._chunks is None:
+            return None
+        return b''.join(self._chunks)
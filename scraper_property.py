@@ -1,48 +1,100 @@
 ### base module
 
+import itertools
 import re
-import lxml
+from lxml import etree
+from . import row_stream
+
+
+# inner expressions, compiled once like the descriptors' own
+QUERYFIELD_X = etree.XPath('.//td[@class="queryfield"][text()="X"]', smart_strings=False)
+FONTS = etree.XPath('.//font', smart_strings=False)
+DATE = re.compile(r'(\d{2}/\d{2}/\d{4})', re.MULTILINE)
+PRINTABLE = re.compile(r'^([ -~]+)$')
+
+
+def iter_texts(element):
+    """
+        yields (node, node.text) for @element and every node below it
+        that has text, children before their parent,
+        walked with a stack instead of a Python frame per level
+    """
+    stack = [(element, element.iterchildren())]
+    while stack:
+        node, children = stack[-1]
+        child = next(children, None)
+        if child is not None:
+            stack.append((child, child.iterchildren()))
+            continue
+        stack.pop()
+        if node.text is not None:
+            yield node, node.text
 
 
 class ScraperProperty:
     """
         descriptor
-        @path_expr: xpath to entity
+        @path_expr: xpath to entity, compiled once when the page class is created
         @fields: field names to create dict
 
         use htmlEntity root returned by xpath
-        recurse though children
+        walk though children, see iter_texts
         return child.text if not None
+
+        the value is extracted on first read and kept on the page,
+        page.invalidate() drops it
+        pages with an extraction_backend or extraction_plan
+        extract all their fields on the first read
     """
     def __init__(self, expr, fields=[]):
         self.expr = expr
+        # text() results come back as plain str, nothing needs their parent
+        self.xpath = etree.XPath(expr, smart_strings=False)
         self.fields = fields
+        self.name = None
 
-    def __get__(self, instance, cls):
-        node = instance.root.xpath(self.expr)
-        assert(node is not None)
+    def __set_name__(self, owner, name):
+        self.name = name
 
-        def get_text(element, text_list):
-            """
-                recurse down this ElementTree node:
-                either get a node with text
-                or a text node (represented as _ElementUnicodeResult by etree)
-            """
-            if type(element) == lxml.etree._ElementUnicodeResult:
-                text_list.append(element)
-            else:
-                for child in element.getchildren():
-                    get_text(child, text_list)
-
-                if element.text is not None:
-                    text_list.append(element.text)
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        if self.name is None:
+            return self.extract(instance)
+        extracted = instance.__dict__.setdefault('_extracted', {})
+        try:
+            return extracted[self.name]
+        except KeyError:
+            pass
+        backend = getattr(instance, 'extraction_backend', None) or getattr(instance, 'extraction_plan', None)
+        if backend is not None and not extracted:
+            # the first read of a planned page extracts every field at once
+            backend.fill(instance, extracted)
+            if self.name in extracted:
+                return extracted[self.name]
+        value = extracted[self.name] = self.extract(instance)
+        return value
+
+    def extract(self, instance):
+        return self.from_nodes(self.xpath(instance.root))
+
+    def from_nodes(self, node):
+        """
+            @node: result of this property's xpath,
+                evaluated here or by an ExtractionPlan
+        """
+        assert(node is not None)
 
         text_list = []
         if hasattr(node, 'text') and node.text is not None:
             text_list.append(node.text)
         else:
             for elem in node:
-                get_text(elem, text_list)
+                if isinstance(elem, str):
+                    # a text node
+                    text_list.append(elem)
+                else:
+                    text_list.extend(text for element, text in iter_texts(elem))
 
         # there are sometimes 2 text elements in a node
         # more than 3 is surely a problem
@@ -59,20 +111,19 @@ class ScraperProperty:
 
 
 class ScraperListProperty(ScraperProperty):
-    def __get__(self, instance, instance_type=None):
+    def from_nodes(self, node):
         """
             safer uses 'X' next to cargo carried
             search for 'X'
             iterate through siblings (in td)
             to get string for cargo
         """
-        node = instance.root.xpath(self.expr)
         data = []
-        for td in node[0].xpath('.//td[@class="queryfield"][text()="X"]'):
+        for td in QUERYFIELD_X(node[0]):
             for field in td.itersiblings():
                 if field.text and field.text != 'X':
                     data.append(field.text)
-                for item in field.xpath('.//font'):
+                for item in FONTS(field):
                     data.append(item.text)
         return data
 
@@ -81,15 +132,14 @@ class ScraperListProperty(ScraperProperty):
 
 
 class ScraperDateProperty(ScraperProperty):
-    def __get__(self, instance, cls=None):
+    def from_nodes(self, node):
         """
             be sure we are getting a date
             or return None
         """
-        date_tag = super().__get__(instance, cls=None)  # Let super class do recursion
-        pat = re.compile(r'(\d{2}/\d{2}/\d{4})', re.MULTILINE)
+        date_tag = super().from_nodes(node)  # Let super class do recursion
         if date_tag and type(date_tag) == str:
-            m = pat.search(date_tag)
+            m = DATE.search(date_tag)
             if m:
                 return m.group(1)
             else:
@@ -99,15 +149,60 @@ class ScraperDateProperty(ScraperProperty):
         raise AttributeError("Cannot set this ScraperDate property")
 
 
-class ScraperTableProperty(ScraperProperty):
-    def __get__(self, instance, cls=None):
-        """ specific to insurance sub pages
-            data in tr/center/font
+class TableRowsProperty(ScraperProperty):
+    """
+        base of the properties returning one dict per tr[@align="LEFT"]
+        of the table @expr selects
+        subclasses turn a row into its dict in row()
+    """
+    def is_row(self, tr):
+        return tr.tag == 'tr' and tr.attrib.get('align') == 'LEFT'
+
+    def row(self, tr):
+        """ the dict of @tr, None to leave it out """
+        raise TypeError("{0} does not build rows, use a TableRowsProperty subclass with a row()".format(
+            type(self).__name__))
+
+    def row_complete(self, tr):
+        """ True once the rows parsed so far are enough to build @tr's dict """
+        return True
+
+    def from_nodes(self, table):
+        rows = []
+        for tr in table[0].getchildren():
+            if self.is_row(tr):
+                data = self.row(tr)
+                if data is not None:
+                    rows.append(data)
+        return rows
+
+    def streams(self, instance):
+        """ True when iter_rows reads @instance's html rather than its tree """
+        if self.name in instance.__dict__.get('_extracted', {}):
+            return False
+        return (getattr(instance, 'html_body', None) is not None
+                and getattr(instance, '_root', None) is None
+                and row_stream.streamable(self.expr))
+
+    def iter_rows(self, instance, watch=None):
+        """
+            the rows one at a time, streamed from the page's html
+            when its tree was never built, so memory is bounded per row
+            rather than per page
+            @watch: see row_stream.iter_rows, only called when streaming
         """
-        table = instance.root.xpath(self.expr)
+        if not self.streams(instance):
+            return iter(self.__get__(instance))
+        return row_stream.iter_rows(self, instance.html_body, watch)
 
+
+class ScraperTableProperty(TableRowsProperty):
+    """ specific to insurance sub pages
+        data in tr/center/font
+    """
+    def row(self, tr):
         def get_text(element):
-            font = element.xpath('.//font')
+            font = FONTS(element)
             if font and font != []:
                 for f in font:
                     if f.text is not None:
@@ -117,84 +212,57 @@ class ScraperTableProperty(ScraperProperty):
             else:
                 yield(" ")
 
-        rows = table[0].xpath('tr[@align="LEFT"]')
-        l = []
-        for row in rows:
-            l.append(dict(zip(self.fields, [text for text in get_text(row)])))
-        return l
-
-
-class ScraperRowProperty(ScraperProperty):
-    def __get__(self, instance, cls=None):
-        table = instance.root.xpath(self.expr)
-        assert(table is not None)
-
-        def get_text(element, text_list):
-            """
-                similar to recursive method above
-                keep one table's row of text in a list
-            """
-            if type(element) == lxml.etree._ElementUnicodeResult:
-                text_list.append(str(element))
-            else:
-                for child in element.getchildren():
-                    get_text(child, text_list)
+        return dict(zip(self.fields, [text for text in get_text(tr)]))
 
-                if element.text is not None:
-                    m = re.match(r'^([ -~]+)$', element.text)
-                    if m:
-                        text_list.append(m.group(1))
-                    if element.tag == 'td' and element.text == '':
-                        text_list.append(' ')
-                        #get_text(element, text_list)
 
-            return text_list
+class ScraperRowProperty(TableRowsProperty):
+    def row(self, tr):
+        # keep one table's row of text in a list:
+        # printable ASCII texts, and a space for an empty td
+        text_list = []
+        for element, text in iter_texts(tr):
+            m = PRINTABLE.match(text)
+            if m:
+                text_list.append(m.group(1))
+            if element.tag == 'td' and text == '':
+                text_list.append(' ')
 
-        # Get the text list:
         # zip it up with fields passed in constructor
         # to create a dictionary
         # one dictionary per row of table
-        rows = []
-        data = {}
-        for tr in table[0].getchildren():
-            if tr.tag == 'tr' and tr.attrib.get('align') == 'LEFT':
-                text_list = get_text(tr, [])
-                data = dict(zip(self.fields, text_list))
-                rows.append(data)
-        return rows
+        return dict(zip(self.fields, text_list))
 
     def __set__(self, instance, value):
         raise AttributeError("Cannot set this ScraperRows property")
 
 
-class ScraperRevocationProperty(ScraperProperty):
+class ScraperRevocationProperty(TableRowsProperty):
     """
         Special property for revocation pages
         all text is inside center>font
         if a cell in the scraped table
         is empty, that cell is either a th or td
         and has no center tag inside
-    """
-    def __get__(self, instance, cls=None):
-        table = instance.root.xpath(self.expr)
-
-        def get_text(row):
-            for td in row.itersiblings():
-                for child in td.getchildren():
-                    grandchildren = child.getchildren()
-                    if grandchildren != []:
-                        for grandchild in grandchildren:
-                            if grandchild.tag == 'center':
-                                font = child.xpath('.//font')
-                                yield(font[0].text)
-                    else:
-                        yield(" ")
 
-        rows = table[0].xpath('tr[@align="LEFT"]')
-        l = []
-        for row in rows:
-            d = dict(zip(self.fields, [text for text in get_text(row)]))
-            if d != {}:
-                l.append(d)
-            #l.append(dict(zip(self.fields, [text for text in get_text(row)])))
-        return l
+        a row's values are read from the rows after it
+    """
+    def values(self, tr):
+        for td in tr.itersiblings():
+            for child in td.getchildren():
+                grandchildren = child.getchildren()
+                if grandchildren != []:
+                    for grandchild in grandchildren:
+                        if grandchild.tag == 'center':
+                            font = FONTS(child)
+                            yield(font[0].text)
+                else:
+                    yield(" ")
+
+    def row(self, tr):
+        d = dict(zip(self.fields, [text for text in self.values(tr)]))
+        if d != {}:
+            return d
+        return None
+
+    def row_complete(self, tr):
+        return len(list(itertools.islice(self.values(tr), len(self.fields)))) == len(self.fields)